@@ -0,0 +1,260 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import db
+import logs_io
+import metrics
+from cache import TTLCache, MISSING
+from config import (
+    DB_READ_THREADS, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL,
+    LOG_WRITE_MODE, LOG_FLUSH_MS, LOG_FLUSH_ROWS
+)
+
+# SQLite допускает только одного писателя, поэтому все записи идут через один
+# поток: очередь ThreadPoolExecutor сохраняет порядок запросов, а event loop
+# не ждёт fsync. Чтения выполняются параллельно в отдельном пуле.
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+_readers = ThreadPoolExecutor(max_workers=DB_READ_THREADS, thread_name_prefix='db-reader')
+
+# профили читаются почти в каждом апдейте, а меняются только через
+# create_or_update_user, который сразу обновляет кэш
+_profiles = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+_profile_writes = 0
+stats = {'reads': 0, 'writes': 0}
+
+
+async def _read(fn, *args, **kwargs):
+    stats['reads'] += 1
+    loop = asyncio.get_running_loop()
+    with metrics.timer(metrics.db_latency, fn.__name__, 'read'):
+        return await loop.run_in_executor(_readers, partial(fn, *args, **kwargs))
+
+
+async def _write(fn, *args, **kwargs):
+    stats['writes'] += 1
+    loop = asyncio.get_running_loop()
+    with metrics.timer(metrics.db_latency, fn.__name__, 'write'):
+        return await loop.run_in_executor(_writer, partial(fn, *args, **kwargs))
+
+
+class LogBuffer:
+    # Записи логов копятся в памяти и пишутся одной транзакцией через interval
+    # секунд после первой записи пачки или сразу, как набралось max_rows строк.
+    # С wait=True вызывающий ждёт коммита своей пачки и получает ошибку записи,
+    # с wait=False возвращается сразу, а неудачная пачка остаётся в буфере.
+    # Чтения итогов пользователя сначала сбрасывают его ещё не записанные строки.
+    def __init__(self, interval, max_rows, wait):
+        self.interval = interval
+        self.max_rows = max_rows
+        self.wait = wait
+        self._entries = []
+        self._waiters = []
+        self._users = set()
+        self._flushing = set()
+        self._timer = None
+        self._lock = asyncio.Lock()
+
+    async def add(self, entry):
+        self._entries.append(entry)
+        self._users.add(entry[1][0])
+        waiter = None
+        if self.wait:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+        if len(self._entries) >= self.max_rows:
+            try:
+                await self.flush()
+            except Exception:
+                # с ожиданием ошибка придёт через waiter, без него пачка осталась в буфере
+                if waiter is None:
+                    logging.exception('log buffer flush failed')
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        if waiter is not None:
+            await waiter
+
+    async def flush(self):
+        async with self._lock:
+            if not self._entries:
+                return
+            entries, self._entries = self._entries, []
+            waiters, self._waiters = self._waiters, []
+            self._flushing, self._users = self._users, set()
+            write = asyncio.ensure_future(_write(db.write_logs, entries))
+            write.add_done_callback(partial(self._written, entries, waiters))
+            try:
+                # отмена flush не прерывает уже начатую запись пачки
+                await asyncio.shield(write)
+            finally:
+                self._flushing = set()
+
+    def _written(self, entries, waiters, write):
+        if write.cancelled():
+            for waiter in waiters:
+                waiter.cancel()
+            return
+        error = write.exception()
+        if error is not None and not waiters:
+            self._entries[:0] = entries
+            self._users.update(params[0] for _, params in entries)
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
+
+    async def sync_user(self, user_id):
+        if user_id in self._users or user_id in self._flushing:
+            await self.flush()
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+        except Exception:
+            logging.exception('log buffer flush failed')
+        finally:
+            self._timer = None
+        if self._entries:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+
+def create_log_buffer(mode):
+    # в режиме 'group' следующая пачка пишется сразу после коммита предыдущей:
+    # пока идёт запись, в буфере копятся записи от других обработчиков
+    if mode == 'group':
+        return LogBuffer(0, LOG_FLUSH_ROWS, wait=True)
+    if mode == 'behind':
+        return LogBuffer(LOG_FLUSH_MS / 1000, LOG_FLUSH_ROWS, wait=False)
+    return None
+
+
+_log_buffer = create_log_buffer(LOG_WRITE_MODE)
+
+
+async def _log(entry):
+    if _log_buffer is None:
+        await _write(db.write_logs, [entry])
+    else:
+        await _log_buffer.add(entry)
+
+
+async def flush_logs():
+    if _log_buffer is not None:
+        await _log_buffer.close()
+
+
+async def init_db():
+    await _write(db.init_db)
+
+
+async def get_user_data(user_id: int):
+    return await _read(db.get_user_data, user_id)
+
+
+async def get_profile(user_id: int):
+    profile = _profiles.get(user_id, MISSING)
+    if profile is MISSING:
+        writes = _profile_writes
+        profile = db.Profile.from_row(await _read(db.get_user_data, user_id))
+        # если профиль успели перезаписать, пока шло чтение, прочитанное уже устарело
+        if writes == _profile_writes:
+            _profiles.set(user_id, profile)
+    return profile
+
+
+async def create_or_update_user(user_id: int, **kwargs):
+    global _profile_writes
+    _profile_writes += 1
+    profile = await _write(db.save_user, user_id, **kwargs)
+    _profiles.set(user_id, profile)
+    return profile
+
+
+async def log_water(user_id: int, amount: float):
+    await _log(db.log_entry('water', user_id, amount))
+
+
+async def log_food(user_id: int, product_name: str, calories: float, grams: float):
+    await _log(db.log_entry('food', user_id, product_name, calories, grams))
+
+
+async def log_workout(user_id: int, wtype: str, duration: float, burned: float):
+    await _log(db.log_entry('workout', user_id, wtype, duration, burned))
+
+
+async def get_daily_totals(user_id: int, first_day: str, days: int):
+    if _log_buffer is not None:
+        await _log_buffer.sync_user(user_id)
+    return await _read(db.get_daily_totals, user_id, first_day, days)
+
+
+async def get_day_totals(user_id: int, day: str):
+    if _log_buffer is not None:
+        await _log_buffer.sync_user(user_id)
+    return await _read(db.get_day_totals, user_id, day)
+
+
+async def export_user_logs(user_id: int, fmt: str):
+    if _log_buffer is not None:
+        await _log_buffer.sync_user(user_id)
+    return await _read(logs_io.export_user_file, user_id, fmt)
+
+
+async def get_user_cities():
+    return await _read(db.get_user_cities)
+
+
+async def get_summary_candidates(cities, day: str, offset: int = 0):
+    # итоги в сводке должны учитывать ещё не записанные логи всех пользователей
+    if _log_buffer is not None:
+        await _log_buffer.flush()
+    return await _read(db.get_summary_candidates, cities, day, offset)
+
+
+async def mark_summaries_sent(sent):
+    await _write(db.mark_summaries_sent, sent)
+
+
+async def get_cached_products(name: str, owners):
+    return await _read(db.get_cached_products, name, owners)
+
+
+async def save_cached_product(owner: int, name: str, kcal_100g, source: str):
+    return await _write(db.save_cached_product, owner, name, kcal_100g, source)
+
+
+async def get_translation(text: str):
+    return await _read(db.get_translation, text)
+
+
+async def save_translation(text: str, translated: str):
+    await _write(db.save_translation, text, translated)
+
+
+async def get_fsm_record(key: str):
+    return await _read(db.get_fsm_record, key)
+
+
+async def save_fsm_records(upserts, deletes):
+    await _write(db.save_fsm_records, upserts, deletes)
+
+
+async def purge_fsm_records(older_than: float):
+    return await _write(db.purge_fsm_records, older_than)
+
+
+def shutdown():
+    _writer.shutdown(wait=True)
+    _readers.shutdown(wait=True)
+    db.close_connections()
@@ -0,0 +1,15 @@
+# Общая подготовка скриптов bench/: корень репозитория в sys.path и своя
+# временная БД в WORKDIR (DB_NAME задаётся до первого импорта config).
+# Импортируется каждым скриптом до модулей бота:
+#     import _setup  # noqa: F401
+# Дочерние процессы (spawn) заново импортируют скрипт, но по BENCH_WORKDIR
+# из окружения получают ту же папку и ту же БД, что и родитель.
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = os.environ.setdefault('BENCH_WORKDIR', tempfile.mkdtemp(prefix='bench-'))
+os.environ['DB_NAME'] = os.path.join(WORKDIR, 'bench.db')
@@ -0,0 +1,90 @@
+# Рендеринг графиков: прежний pyplot прямо в event loop против пула процессов
+# из charts.py. Печатает renders/sec и максимальную задержку event loop.
+# Запуск: python bench/charts.py [N]
+import asyncio
+import random
+import sys
+import time
+from datetime import date, timedelta, datetime
+from io import BytesIO
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.dates as mdates  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+
+import _setup  # noqa: E402,F401
+
+import charts  # noqa: E402
+
+
+def sample_rows():
+    first = date(2026, 10, 1)
+    return [
+        ((first + timedelta(days=i)).isoformat(), random.uniform(0, 3000),
+         random.uniform(0, 2500), random.uniform(0, 800))
+        for i in range(7)
+    ]
+
+
+def render_pyplot(rows):
+    days_dt = [datetime.strptime(row[0], '%Y-%m-%d') for row in rows]
+    fig, ax = plt.subplots(nrows=3, ncols=1, figsize=(6, 10))
+    for i, color in enumerate(('blue', 'red', 'green')):
+        ax[i].plot(days_dt, [row[i + 1] for row in rows], marker='o', color=color)
+        ax[i].set_title('series')
+        ax[i].grid(True)
+        ax[i].tick_params(axis='x', rotation=45)
+        ax[i].xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+    plt.tight_layout()
+    bio = BytesIO()
+    plt.savefig(bio, format='png')
+    plt.close(fig)
+    return bio.getvalue()
+
+
+async def inline(rows):
+    return render_pyplot(rows)
+
+
+async def pooled(rows):
+    while True:
+        try:
+            return await charts.render_daily_totals(rows)
+        except charts.ChartQueueFull:
+            await asyncio.sleep(0.01)
+
+
+async def loop_lag(stop):
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - start - 0.001)
+    return worst
+
+
+async def run(render, n):
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(loop_lag(stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(render(sample_rows()) for _ in range(n)))
+    total = time.perf_counter() - start
+    stop.set()
+    return n / total, await lag_task * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    render_pyplot(sample_rows())
+    asyncio.run(pooled(sample_rows()))  # поднимаем воркеры заранее
+    print(f'{"mode":<10}{"renders/s":>12}{"max loop stall ms":>20}')
+    for name, render in (('inline', inline), ('pool', pooled)):
+        rate, lag = asyncio.run(run(render, n))
+        print(f'{name:<10}{rate:>12.1f}{lag:>20.1f}')
+    charts.shutdown()
+
+
+if __name__ == '__main__':
+    main()
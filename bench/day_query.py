@@ -0,0 +1,83 @@
+# Синтетическая БД с миллионами записей в логах: план запроса и задержка
+# суммы за день для старого фильтра date(timestamp)=? без индексов и для
+# полуинтервала по timestamp после миграции с индексами (user_id, timestamp).
+# Запуск: python bench/day_query.py [строк_на_таблицу] [пользователей]
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import _setup  # noqa: F401
+
+import db  # noqa: E402
+
+OLD_SQL = 'SELECT SUM(amount) FROM water_logs WHERE user_id=? AND date(timestamp)=?'
+NEW_SQL = 'SELECT SUM(amount) FROM water_logs WHERE user_id=? AND timestamp >= ? AND timestamp < ?'
+DAYS = 365
+
+
+def timestamps(n):
+    now = datetime(2026, 1, 1)
+    for _ in range(n):
+        ts = now - timedelta(seconds=random.randrange(DAYS * 86400))
+        yield ts.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def fill(conn, rows, users):
+    with conn:
+        conn.executemany(
+            'INSERT INTO water_logs (user_id, amount, timestamp) VALUES (?,?,?)',
+            ((random.randrange(users), 250, ts) for ts in timestamps(rows)))
+        conn.executemany(
+            'INSERT INTO food_logs (user_id, product_name, calories, grams, timestamp) VALUES (?,?,?,?,?)',
+            ((random.randrange(users), 'banana', 107, 120, ts) for ts in timestamps(rows)))
+        conn.executemany(
+            'INSERT INTO workout_logs (user_id, workout_type, duration_minutes, calories_burned, timestamp) '
+            'VALUES (?,?,?,?,?)',
+            ((random.randrange(users), 'Бег', 30, 300, ts) for ts in timestamps(rows)))
+
+
+def measure(conn, sql, make_params, users, n=200):
+    start = time.perf_counter()
+    for _ in range(n):
+        conn.execute(sql, make_params(random.randrange(users))).fetchone()
+    return (time.perf_counter() - start) / n * 1000
+
+
+def plan(conn, sql, params):
+    return '; '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    db.init_db()
+    conn = db.get_connection()
+    for table in ('water_logs', 'food_logs', 'workout_logs'):
+        conn.execute(f'DROP INDEX IF EXISTS idx_{table}_user_ts')
+    conn.execute('PRAGMA user_version=0')
+
+    start = time.perf_counter()
+    fill(conn, rows, users)
+    print(f'filled {3 * rows} log rows in {time.perf_counter() - start:.1f}s')
+
+    day = '2025-12-15'
+    start_day, end_day = db.day_range(day)
+    old_params = lambda uid: (uid, day)  # noqa: E731
+    new_params = lambda uid: (uid, start_day, end_day)  # noqa: E731
+
+    print('before:', plan(conn, OLD_SQL, old_params(1)))
+    before = measure(conn, OLD_SQL, old_params, users, n=20)
+
+    start = time.perf_counter()
+    db.migrate(conn)
+    print(f'migration (index build) took {time.perf_counter() - start:.1f}s')
+    print('after: ', plan(conn, NEW_SQL, new_params(1)))
+    after = measure(conn, NEW_SQL, new_params, users)
+
+    print(f'day sum latency: {before:.2f} ms -> {after:.3f} ms ({before / after:.0f}x)')
+    db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
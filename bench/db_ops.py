@@ -0,0 +1,73 @@
+# Сравнение ops/sec для log_water/get_user_data/create_or_update_user: соединение
+# на каждый вызов (как было раньше) против долгоживущего соединения из
+# db.get_connection(); для профиля ещё и SELECT + UPDATE против одного UPSERT.
+# Запуск: python bench/db_ops.py [N]
+import sqlite3
+import sys
+import time
+
+import _setup  # noqa: F401
+
+import db  # noqa: E402
+from config import DB_NAME  # noqa: E402
+
+
+def old_log_water(user_id, amount):
+    conn = sqlite3.connect(DB_NAME)
+    cur = conn.cursor()
+    cur.execute('INSERT INTO water_logs (user_id, amount) VALUES (?,?)', (user_id, amount))
+    conn.commit()
+    conn.close()
+
+
+def old_get_user_data(user_id):
+    conn = sqlite3.connect(DB_NAME)
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM users WHERE user_id=?', (user_id,))
+    row = cur.fetchone()
+    conn.close()
+    return row
+
+
+def old_create_or_update_user(user_id, **kwargs):
+    conn = sqlite3.connect(DB_NAME)
+    cur = conn.cursor()
+    cur.execute('SELECT user_id FROM users WHERE user_id=?', (user_id,))
+    if cur.fetchone():
+        sets = ','.join(f'{k}=?' for k in kwargs)
+        cur.execute(f'UPDATE users SET {sets} WHERE user_id=?', (*kwargs.values(), user_id))
+    else:
+        cols = ','.join(kwargs)
+        marks = ','.join(['?'] * (len(kwargs) + 1))
+        cur.execute(f'INSERT INTO users (user_id, {cols}) VALUES ({marks})', (user_id, *kwargs.values()))
+    conn.commit()
+    conn.close()
+
+
+def measure(fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i % 100)
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db.init_db()
+    for uid in range(100):
+        db.create_or_update_user(uid, weight=70, height=175, age=30, gender='м',
+                                 activity_level='med', goal='maint', city='Moscow')
+    results = [
+        ('log_water', measure(lambda u: old_log_water(u, 250), n), measure(lambda u: db.log_water(u, 250), n)),
+        ('get_user_data', measure(old_get_user_data, n), measure(db.get_user_data, n)),
+        ('create_or_update_user', measure(lambda u: old_create_or_update_user(u, weight=71, city='Kazan'), n),
+         measure(lambda u: db.create_or_update_user(u, weight=71, city='Kazan'), n)),
+    ]
+    print(f'{"operation":<24}{"before ops/s":>14}{"after ops/s":>14}{"speedup":>10}')
+    for name, before, after in results:
+        print(f'{name:<24}{before:>14.0f}{after:>14.0f}{after / before:>9.1f}x')
+    db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
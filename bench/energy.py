@@ -0,0 +1,67 @@
+# Цели (BMR, калории, цель сжигания, вода) для миллиона синтетических профилей:
+# векторный расчёт energy.targets против цикла по скалярным функциям.
+# Скалярный цикл меряется на части профилей и пересчитывается на весь набор;
+# на этой же части результаты сверяются с векторными.
+# Запуск: python bench/energy.py [профилей]
+import random
+import sys
+import time
+
+import numpy as np
+
+import _setup  # noqa: F401
+
+import energy  # noqa: E402
+
+SCALAR_ROWS = 100_000
+
+
+def synthetic_rows(n):
+    rnd = random.Random(1)
+    genders = ('м', 'ж', '')
+    levels = tuple(energy.activity_factor) + ('?',)
+    goals = tuple(energy.goal_factor)
+    for uid in range(n):
+        yield (uid, rnd.uniform(45, 130), rnd.uniform(150, 200), rnd.randrange(16, 80),
+               rnd.choice(genders), rnd.choice(levels), rnd.choice(goals))
+
+
+def scalar(rows, temps):
+    out = []
+    for (_, weight, height, age, gender, activity, goal), temp in zip(rows, temps):
+        out.append((
+            energy.raw_bmr(weight, height, age, gender),
+            energy.calculate_daily_calories(weight, height, age, gender, activity, goal),
+            energy.calculate_burn_goal(weight, height, age, gender, activity, goal),
+            energy.calculate_daily_water(weight, activity, temp),
+        ))
+    return out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rows = list(synthetic_rows(n))
+    temps = np.random.default_rng(1).uniform(-10, 35, n)
+
+    start = time.perf_counter()
+    profiles = energy.ProfileArrays.from_rows(rows)
+    encode = time.perf_counter() - start
+    start = time.perf_counter()
+    result = energy.targets(profiles, temps)
+    vector = time.perf_counter() - start
+    print(f'{n} profiles: rows -> arrays {encode * 1000:.0f} ms, targets {vector * 1000:.1f} ms')
+
+    m = min(n, SCALAR_ROWS)
+    start = time.perf_counter()
+    expected = scalar(rows[:m], temps[:m].tolist())
+    per_row = (time.perf_counter() - start) / m
+    print(f'scalar loop: {per_row * 1e6:.1f} us/profile, ~{per_row * n:.1f} s for {n} '
+          f'({per_row * n / vector:.0f}x slower than targets)')
+
+    got = np.column_stack([result.bmr[:m], result.calories[:m], result.burn_goal[:m], result.water[:m]])
+    assert np.allclose(got, np.array(expected), rtol=0, atol=1e-9), 'vector and scalar results differ'
+    print(f'vector and scalar results match on {m} profiles')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Цена журнала событий на апдейт для event loop: прежний LoggerMiddleware
+# (f-строка и синхронная запись в поток вывода на каждый апдейт) против
+# EventLogMiddleware с очередью и фоновым потоком в текстовом и JSONL-формате
+# и с сэмплированием 10%. Вывод идёт во временный файл; отдельно печатается,
+# сколько фоновый поток дописывал остаток очереди после прогона.
+# Запуск: python bench/eventlog.py [апдейтов]
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import CallbackQuery, Message, Update
+
+import _setup  # noqa: E402
+
+import eventlog  # noqa: E402
+from middlewares import EventLogMiddleware  # noqa: E402
+
+
+class LoggerMiddleware(BaseMiddleware):
+    # middlewares.LoggerMiddleware до перехода на eventlog
+    async def __call__(self, handler, event, data):
+        if isinstance(event, Message):
+            text = event.text or ''
+            user_id = event.from_user.id if event.from_user else 'unknown'
+            logging.info(f'[Message] User {user_id} sent: {text}')
+        elif isinstance(event, CallbackQuery):
+            user_id = event.from_user.id if event.from_user else 'unknown'
+            data_cb = event.data
+            logging.info(f'[Callback] User {user_id} pressed: {data_cb}')
+        return await handler(event, data)
+
+
+async def cmd_check_progress(event, data):
+    return None
+
+
+def make_data(i):
+    user = {'id': 1000 + i % 100, 'is_bot': False, 'first_name': 'Bench'}
+    update = Update(update_id=i, message={
+        'message_id': i, 'date': int(time.time()), 'chat': {'id': user['id'], 'type': 'private'},
+        'from': user, 'text': '/check_progress',
+    })
+    return update.message, {
+        'event_update': update, 'event_from_user': update.message.from_user,
+        'handler': HandlerObject(callback=cmd_check_progress),
+    }
+
+
+async def run(middleware, updates):
+    event, data = make_data(1)
+    start = time.perf_counter()
+    for _ in range(updates):
+        await middleware(cmd_check_progress, event, data)
+    return (time.perf_counter() - start) / updates
+
+
+def baseline(path, updates):
+    sink = logging.FileHandler(path, encoding='utf-8')
+    sink.setFormatter(logging.Formatter(eventlog.TEXT_FORMAT))
+    root = logging.getLogger()
+    root.handlers[:] = [sink]
+    root.setLevel(logging.INFO)
+    per_update = asyncio.run(run(LoggerMiddleware(), updates))
+    sink.close()
+    return per_update, 0.0
+
+
+def queued(path, updates, fmt, sampling):
+    eventlog.setup(fmt=fmt, path=path, sampling=sampling, rate_limit=0)
+    per_update = asyncio.run(run(EventLogMiddleware(), updates))
+    start = time.perf_counter()
+    eventlog.shutdown()
+    return per_update, time.perf_counter() - start
+
+
+def main():
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    variants = [
+        ('LoggerMiddleware', lambda path: baseline(path, updates)),
+        ('eventlog text', lambda path: queued(path, updates, 'text', '')),
+        ('eventlog jsonl', lambda path: queued(path, updates, 'jsonl', '')),
+        ('eventlog jsonl 10%', lambda path: queued(path, updates, 'jsonl', 'INFO:0.1')),
+    ]
+    print(f'{"variant":<20} {"us/update on loop":>18} {"drain ms":>9} {"lines":>8} {"bytes/line":>11}')
+    for name, fn in variants:
+        path = os.path.join(_setup.WORKDIR, name.replace(' ', '_') + '.log')
+        per_update, drain = fn(path)
+        with open(path, 'rb') as f:
+            lines = f.read().splitlines()
+        size = sum(len(line) + 1 for line in lines)
+        print(f'{name:<20} {per_update * 1e6:>18.2f} {drain * 1000:>9.0f} {len(lines):>8} '
+              f'{size / max(len(lines), 1):>11.0f}')
+    print(open(os.path.join(_setup.WORKDIR, 'eventlog_jsonl.log'), encoding='utf-8').readline().strip())
+
+
+if __name__ == '__main__':
+    main()
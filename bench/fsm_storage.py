@@ -0,0 +1,49 @@
+# Пропускная способность get/set состояния FSM: MemoryStorage против SQLiteStorage.
+# Один «шаг диалога» = get_state + set_state + update_data + get_data.
+# Запуск: python bench/fsm_storage.py [шагов] [пользователей]
+import asyncio
+import sys
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import _setup  # noqa: F401
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+from fsm_storage import SQLiteStorage  # noqa: E402
+
+
+async def step(storage, key, i):
+    await storage.get_state(None, key)
+    await storage.set_state(None, key, 'FoodLogStates:waiting_for_food_weight')
+    await storage.update_data(None, key, {'food_name': 'гречка', 'grams': i})
+    await storage.get_data(None, key)
+
+
+async def run(storage, steps, users):
+    keys = [StorageKey(bot_id=1, chat_id=uid, user_id=uid) for uid in range(users)]
+    start = time.perf_counter()
+    for i in range(0, steps, users):
+        await asyncio.gather(*(step(storage, key, i) for key in keys))
+    elapsed = time.perf_counter() - start
+    await storage.close()
+    return steps / elapsed
+
+
+def main():
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    db.init_db()
+    print(f'{"storage":<14}{"steps/s":>12}{"ops/s":>12}')
+    for name, storage in (('memory', MemoryStorage()), ('sqlite', SQLiteStorage())):
+        rate = asyncio.run(run(storage, steps, users))
+        print(f'{name:<14}{rate:>12.0f}{rate * 4:>12.0f}')
+    rows = db.get_connection().execute('SELECT COUNT(*) FROM fsm_states').fetchone()[0]
+    print(f'persisted dialogs: {rows}')
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
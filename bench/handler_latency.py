@@ -0,0 +1,161 @@
+# Нагрузочный тест: тысячи одновременных апдейтов через диспетчер бота
+# (main.create_dispatcher: фильтры, FSM, middleware, handlers.py) с фейковой
+# сессией Telegram — с синхронным доступом к БД (прямо в event loop) и через
+# async_db. Каждый пользователь по кругу присылает /log_water, количество воды
+# (ответ в состоянии FSM, запись в БД), /start и /help; профиль читает
+# ProfileMiddleware (без кэша профилей).
+# Апдейты приходят с заданной частотой; задержка считается от момента
+# поступления апдейта, так что апдейты, ждущие за блокирующим вызовом, её видят.
+# Печатает p50/p99 задержки (всех апдейтов и /help, которому БД нужна только
+# для профиля) и максимальную задержку event loop.
+# Запуск: python bench/handler_latency.py [N] [апдейтов_в_секунду]
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message, Update
+
+import _setup  # noqa: F401
+os.environ.setdefault('DB_SYNCHRONOUS', 'FULL')
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+import handlers  # noqa: E402
+import middlewares  # noqa: E402
+from main import create_dispatcher  # noqa: E402
+
+USERS = 200
+STEPS = ('/log_water', '250', '/start', '/help')
+
+
+class FakeSession(BaseSession):
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=1, date=datetime.now(), text=method.text,
+                chat=Chat(id=method.chat_id, type='private'),
+            )
+        return True
+
+    async def stream_content(self, url, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def updates(n):
+    # i-й апдейт — от пользователя i % USERS, шаги одного пользователя идут по порядку
+    for i in range(n):
+        uid = 1000 + i % USERS
+        text = STEPS[i // USERS % len(STEPS)]
+        yield ('help' if text == '/help' else 'db'), Update(update_id=i, message={
+            'message_id': i, 'date': int(time.time()), 'text': text,
+            'chat': {'id': uid, 'type': 'private'},
+            'from': {'id': uid, 'is_bot': False, 'first_name': 'Bench'},
+        })
+
+
+def as_sync(fn):
+    async def wrapper(*args, **kwargs):
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def profile_reader(read):
+    async def get_profile(user_id):
+        return db.Profile.from_row(await read(user_id))
+    return get_profile
+
+
+async def loop_lag(stop):
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - start - 0.001)
+    return worst
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[max(int(len(values) * q) - 1, 0)] * 1000
+
+
+async def run(bot, dp, n, rate):
+    latencies = {'db': [], 'help': []}
+    unhandled = 0
+
+    async def timed(kind, update, arrived):
+        nonlocal unhandled
+        if await dp.feed_update(bot, update) is UNHANDLED:
+            unhandled += 1
+        latencies[kind].append(time.perf_counter() - arrived)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(loop_lag(stop))
+    tasks = []
+    start = time.perf_counter()
+    for i, (kind, update) in enumerate(updates(n)):
+        arrive_at = start + i / rate
+        delay = arrive_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(timed(kind, update, arrive_at)))
+    await asyncio.gather(*tasks)
+    total = time.perf_counter() - start
+    stop.set()
+    lag = await lag_task
+    await async_db.flush_logs()
+    # каждый апдейт должен дойти до обработчика через фильтры и состояние FSM
+    assert unhandled == 0, f'{unhandled} updates unhandled'
+    everything = latencies['db'] + latencies['help']
+    return {
+        'p50': statistics.median(everything) * 1000,
+        'p99': percentile(everything, 0.99),
+        'help_p99': percentile(latencies['help'], 0.99),
+        'lag': lag * 1000,
+        'rate': n / total,
+    }
+
+
+async def run_all(n, rate):
+    # диспетчер один на оба режима: router из handlers подключается только однажды
+    bot = Bot(token='42:BENCH', session=FakeSession())
+    dp = create_dispatcher()
+    modes = (
+        ('sync', as_sync(db.log_water), profile_reader(as_sync(db.get_user_data))),
+        ('async', async_db.log_water, profile_reader(async_db.get_user_data)),
+    )
+    print(f'{"mode":<8}{"p50 ms":>10}{"p99 ms":>10}{"/help p99 ms":>14}{"loop lag ms":>14}{"updates/s":>12}')
+    for mode, log_water, get_profile in modes:
+        handlers.log_water = log_water
+        middlewares.get_profile = get_profile
+        r = await run(bot, dp, n, rate)
+        print(f'{mode:<8}{r["p50"]:>10.2f}{r["p99"]:>10.2f}{r["help_p99"]:>14.2f}'
+              f'{r["lag"]:>14.2f}{r["rate"]:>12.0f}')
+    await dp.emit_shutdown(bot=bot)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    db.init_db()
+    for uid in range(1000, 1000 + USERS):
+        db.create_or_update_user(uid, weight=70, height=175, age=30, gender='м',
+                                 activity_level='med', goal='maint', city='Moscow')
+    asyncio.run(run_all(n, rate))
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# Локальная заглушка OpenWeatherMap/USDA с искусственной задержкой и долей
+# ответов 503, через которую гоняются асинхронные weather_api/nutrition_api.
+# Печатает пропускную способность, p50/p99 и число запросов, дошедших до заглушки.
+# Запуск: python bench/http_stub.py [--requests N] [--latency сек] [--fail-rate доля]
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from aiohttp import web
+
+import _setup  # noqa: F401
+
+PORT = 8765
+os.environ['OPENWEATHER_API_URL'] = f'http://127.0.0.1:{PORT}/data/2.5'
+os.environ['USDA_API_URL'] = f'http://127.0.0.1:{PORT}/fdc/v1'
+os.environ.setdefault('HTTP_BACKOFF', '0.01')
+# nutrition_api кэширует ответы в SQLite
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+import http_client  # noqa: E402
+import nutrition_api  # noqa: E402
+import weather_api  # noqa: E402
+
+
+def make_app(latency, fail_rate, hits):
+    async def maybe_fail():
+        hits['total'] += 1
+        await asyncio.sleep(latency)
+        if random.random() < fail_rate:
+            raise web.HTTPServiceUnavailable()
+
+    async def weather(request):
+        await maybe_fail()
+        return web.json_response({'cod': 200, 'main': {'temp': 27.5}, 'timezone': 10800})
+
+    async def foods(request):
+        await maybe_fail()
+        return web.json_response({'foods': [{'foodNutrients': [{'nutrientId': 1008, 'value': 89}]}]})
+
+    app = web.Application()
+    app.router.add_get('/data/2.5/weather', weather)
+    app.router.add_get('/fdc/v1/foods/search', foods)
+    return app
+
+
+async def run(args):
+    hits = {'total': 0}
+    runner = web.AppRunner(make_app(args.latency, args.fail_rate, hits))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', PORT).start()
+
+    latencies = []
+    failures = 0
+
+    async def call(i):
+        nonlocal failures
+        start = time.perf_counter()
+        if i % 2:
+            result = await weather_api.get_temperature(f'city{i % 50}')
+        else:
+            result = await nutrition_api.get_product_calories(f'product{i % 50}')
+        latencies.append(time.perf_counter() - start)
+        if result is None:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(args.requests)))
+    total = time.perf_counter() - start
+    await http_client.close()
+    await runner.cleanup()
+
+    latencies.sort()
+    print(f'requests: {args.requests}, upstream hits: {hits["total"]}, failed lookups: {failures}')
+    print(f'throughput: {args.requests / total:.0f} lookups/s')
+    print(f'p50: {statistics.median(latencies) * 1000:.1f} ms, '
+          f'p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--fail-rate', type=float, default=0.05)
+    db.init_db()
+    asyncio.run(run(parser.parse_args()))
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
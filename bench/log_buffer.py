@@ -0,0 +1,57 @@
+# Пропускная способность записи логов (inserts/sec) при разных LOG_WRITE_MODE:
+# 'sync' (транзакция на запись), 'group' (пачки, вызывающий ждёт коммита) и
+# 'behind' (пачки без ожидания). Параллельные «пользователи» пишут воду и еду,
+# в конце каждый читает свои итоги за день и проверяет, что видит все записи.
+# Запуск: python bench/log_buffer.py [записей] [пользователей]
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import _setup  # noqa: F401
+os.environ.setdefault('DB_SYNCHRONOUS', 'FULL')
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+from config import LOG_FLUSH_MS, LOG_FLUSH_ROWS  # noqa: E402
+
+
+async def user(uid, count):
+    for i in range(count):
+        if i % 2:
+            await async_db.log_food(uid, 'банан', 89.0, 100.0)
+        else:
+            await async_db.log_water(uid, 250.0)
+
+
+async def run(mode, first_uid, total, users):
+    async_db._log_buffer = async_db.create_log_buffer(mode)
+    uids = range(first_uid, first_uid + users)
+    per_user = total // users
+    start = time.perf_counter()
+    await asyncio.gather(*(user(uid, per_user) for uid in uids))
+    # read-your-writes: итоги учитывают записи, ещё лежащие в буфере
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    water, kcal_in, _ = await async_db.get_day_totals(uids[0], today)
+    assert water == 250.0 * ((per_user + 1) // 2), water
+    assert abs(kcal_in - 89.0 * (per_user // 2)) < 1e-6, kcal_in
+    await async_db.flush_logs()
+    elapsed = time.perf_counter() - start
+    return per_user * users / elapsed
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    db.init_db()
+    print(f'behind: flush every {LOG_FLUSH_MS} ms; batches up to {LOG_FLUSH_ROWS} rows, '
+          f'synchronous={os.environ["DB_SYNCHRONOUS"]}')
+    for i, mode in enumerate(('sync', 'group', 'behind')):
+        rate = asyncio.run(run(mode, i * users, total, users))
+        print(f'{mode:<8}{rate:>10.0f} inserts/s')
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Импорт и экспорт логов на синтетическом наборе в несколько миллионов строк.
+# Файл генерируется потоково, затем загружается logs_io.import_logs (executemany
+# пачками по IMPORT_BATCH_SIZE строк в транзакции) и выгружается обратно.
+# Для сравнения часть строк пишется по одной транзакции на строку.
+# Печатает rows/s и пиковое потребление памяти процессом.
+# Запуск: python bench/logs_io.py [строк] [csv|jsonl]
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+import _setup  # noqa: E402
+
+import db  # noqa: E402
+import logs_io  # noqa: E402
+
+USERS = 10_000
+BASELINE_ROWS = 20_000
+
+
+def synthetic_rows(n):
+    rnd = random.Random(1)
+    start = datetime(2024, 1, 1)
+    for i in range(n):
+        uid = rnd.randrange(USERS)
+        ts = (start + timedelta(seconds=i * 7)).strftime('%Y-%m-%d %H:%M:%S')
+        kind = i % 3
+        if kind == 0:
+            yield 'water', uid, ts, rnd.choice((200.0, 250.0, 500.0))
+        elif kind == 1:
+            yield 'food', uid, ts, 'гречка', rnd.uniform(50, 800), rnd.uniform(50, 400)
+        else:
+            yield 'workout', uid, ts, 'Бег', rnd.uniform(10, 90), rnd.uniform(50, 900)
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    fmt = sys.argv[2] if len(sys.argv) > 2 else 'csv'
+    db.init_db()
+    source = os.path.join(_setup.WORKDIR, f'source.{fmt}')
+    with open(source, 'w', encoding='utf-8', newline='') as f:
+        logs_io.WRITERS[fmt](synthetic_rows(n), f)
+    print(f'{n} rows, {os.path.getsize(source) / 2**20:.0f} MB {fmt}, peak RSS {peak_mb():.0f} MB')
+
+    with open(source, encoding='utf-8', newline='') as f:
+        entries = logs_io.READERS[fmt](f)
+        start = time.perf_counter()
+        for _ in range(BASELINE_ROWS):
+            db.write_logs([next(entries)])
+        baseline = BASELINE_ROWS / (time.perf_counter() - start)
+    print(f'row-by-row   {baseline:>10.0f} rows/s (first {BASELINE_ROWS} rows)')
+    db.get_connection().executescript('DELETE FROM water_logs; DELETE FROM food_logs; '
+                                      'DELETE FROM workout_logs; DELETE FROM daily_totals;')
+
+    start = time.perf_counter()
+    with open(source, encoding='utf-8', newline='') as f:
+        imported = logs_io.import_logs(f, fmt)
+    elapsed = time.perf_counter() - start
+    print(f'import       {imported / elapsed:>10.0f} rows/s ({elapsed:.1f}s), peak RSS {peak_mb():.0f} MB')
+
+    target = os.path.join(_setup.WORKDIR, f'export.{fmt}')
+    start = time.perf_counter()
+    with open(target, 'w', encoding='utf-8', newline='') as f:
+        exported = logs_io.export_logs(f, fmt)
+    elapsed = time.perf_counter() - start
+    print(f'export       {exported / elapsed:>10.0f} rows/s ({elapsed:.1f}s), peak RSS {peak_mb():.0f} MB')
+    assert exported == imported == n
+    mismatches = db.check_daily_totals()
+    print(f'daily_totals mismatches after import: {len(mismatches)}')
+    db.close_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# Накладные расходы MetricsMiddleware на апдейт и пример вывода /metrics.
+# Апдейты (/help, /check_progress, RC:foods) прогоняются через Dispatcher
+# с фейковой сессией Telegram, поднимается сервер метрик и печатаются строки
+# ответа /metrics; затем middleware вызывается в цикле с пустым обработчиком,
+# чтобы измерить чистую цену метрик.
+# Запуск: python bench/metrics.py [апдейтов]
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message, Update
+
+import _setup  # noqa: F401
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+import metrics  # noqa: E402
+from fsm_storage import create_storage  # noqa: E402
+from handlers import router  # noqa: E402
+from middlewares import MetricsMiddleware, ProfileMiddleware  # noqa: E402
+
+USERS = 100
+PORT = 9181
+
+
+class FakeSession(BaseSession):
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=1, date=datetime.now(), text=method.text,
+                chat=Chat(id=method.chat_id, type='private'),
+            )
+        return True
+
+    async def stream_content(self, url, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def make_update(i):
+    uid = 1000 + i % USERS
+    user = {'id': uid, 'is_bot': False, 'first_name': 'Bench'}
+    message = {'message_id': i, 'date': int(time.time()), 'chat': {'id': uid, 'type': 'private'}, 'from': user}
+    kind = i % 3
+    if kind == 0:
+        return Update(update_id=i, message={**message, 'text': '/help'})
+    if kind == 1:
+        return Update(update_id=i, message={**message, 'text': '/check_progress'})
+    return Update(update_id=i, callback_query={
+        'id': str(i), 'from': user, 'chat_instance': str(uid),
+        'message': {**message, 'text': 'menu'}, 'data': 'RC:foods',
+    })
+
+
+def make_dispatcher():
+    dp = Dispatcher(storage=create_storage())
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    dp.message.middleware(ProfileMiddleware())
+    dp.callback_query.middleware(ProfileMiddleware())
+    dp.include_router(router)
+    return dp
+
+
+async def run(bot, dp, updates):
+    batch = [make_update(i) for i in range(updates)]
+    start = time.perf_counter()
+    for update in batch:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - start) / updates
+
+
+async def middleware_overhead(n=200_000):
+    async def handler(event, data):
+        return None
+
+    event = make_update(1).message
+    data = {'handler': HandlerObject(callback=handler)}
+    middleware = MetricsMiddleware()
+    start = time.perf_counter()
+    for _ in range(n):
+        await handler(event, data)
+    bare = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n):
+        await middleware(handler, event, data)
+    return (time.perf_counter() - start - bare) / n
+
+
+async def run_all(updates):
+    bot = Bot(token='42:BENCH', session=FakeSession())
+    dp = make_dispatcher()
+    per_update = await run(bot, dp, updates)
+    await dp.emit_shutdown(bot=bot)
+    print(f'{updates} updates through the dispatcher with metrics: {per_update * 1e6:.0f} us/update')
+
+    runner = await metrics.start_server('127.0.0.1', PORT)
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f'http://127.0.0.1:{PORT}/metrics') as resp:
+            text = await resp.text()
+    await runner.cleanup()
+    print(f'/metrics: {len(text.splitlines())} lines, e.g.')
+    for line in text.splitlines():
+        if line.startswith(('bot_updates_total', 'bot_handler_duration_seconds_count',
+                            'db_query_duration_seconds_count', 'cache_hit_ratio')):
+            print('  ' + line)
+    # после /metrics, чтобы пустой обработчик не попал в вывод
+    print(f'MetricsMiddleware overhead: {await middleware_overhead() * 1e6:.2f} us/update')
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
+    db.init_db()
+    for uid in range(1000, 1000 + USERS):
+        db.create_or_update_user(
+            uid, weight=70, height=175, age=30, gender='м',
+            activity_level='med', goal='maint', city=None,
+        )
+    asyncio.run(run_all(updates))
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
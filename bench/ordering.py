@@ -0,0 +1,185 @@
+# Порядок и параллельность обработки апдейтов: несколько сотен чатов присылают
+# по 20 апдейтов вперемешку, обработчик «ходит во внешний API» (asyncio.sleep со
+# случайной задержкой). Печатается время, число апдейтов, обогнавших
+# предыдущий апдейт своего чата, и пик одновременных обработчиков для обычного
+# Dispatcher и OrderedDispatcher; затем — сколько устаревших нажатий кнопок
+# отброшено за медленным обработчиком и сколько апдейтов сверх предела очереди
+# чата отброшено сразу, и что через webhook-сервер апдейты
+# других чатов не ждут очереди одного «горячего» чата (иначе выход с ошибкой).
+# Запуск: python bench/ordering.py [чатов] [апдейтов_на_чат] [лимит]
+import asyncio
+import random
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+import _setup  # noqa: F401
+
+from aiogram import Bot, Dispatcher, Router  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+import ordering  # noqa: E402
+from config import WEBHOOK_PATH, UPDATE_MAX_CONCURRENCY  # noqa: E402
+from ordering import ChatScheduler, OrderedDispatcher  # noqa: E402
+from webhook import WebhookServer  # noqa: E402
+
+PORT = 8768
+HOT_CHAT = 1
+
+
+def raw_message(i, chat_id, text):
+    return {'update_id': i, 'message': {
+        'message_id': i, 'date': int(time.time()), 'text': text,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+    }}
+
+
+def message(i, chat_id, text):
+    return Update(**raw_message(i, chat_id, text))
+
+
+def callback(i, chat_id):
+    return Update(update_id=i, callback_query={
+        'id': str(i), 'chat_instance': 'bench', 'data': 'WT:beg',
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+    })
+
+
+def make_router(seen, running, peak, delay):
+    router = Router()
+
+    @router.message()
+    async def record(msg):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(delay())
+        seen.setdefault(msg.chat.id, []).append(int(msg.text))
+        running[0] -= 1
+
+    return router
+
+
+async def order_run(dp_factory, chats, per_chat):
+    seen, running, peak = {}, [0], [0]
+    dp = dp_factory()
+    dp.include_router(make_router(seen, running, peak, lambda: random.uniform(0, 0.05)))
+    bot = Bot(token='42:BENCH')
+    updates = [message(i, chat, str(seq)) for i, (seq, chat) in
+               enumerate((seq, chat) for seq in range(per_chat) for chat in range(1, chats + 1))]
+    start = time.perf_counter()
+    # как при polling: задача на каждый апдейт в порядке поступления
+    await asyncio.gather(*(asyncio.create_task(dp.feed_update(bot, u)) for u in updates))
+    elapsed = time.perf_counter() - start
+    await bot.session.close()
+    overtaken = sum(a > b for values in seen.values() for a, b in zip(values, values[1:]))
+    return elapsed, overtaken, peak[0]
+
+
+async def shed_run():
+    dp = OrderedDispatcher(scheduler=ChatScheduler(callback_ttl=0.1))
+    router = Router()
+
+    @router.message()
+    async def slow(msg):
+        await asyncio.sleep(0.3)
+
+    @router.callback_query()
+    async def press(query):
+        pass
+
+    dp.include_router(router)
+    bot = Bot(token='42:BENCH')
+    updates = [message(0, 1, 'slow')] + [callback(i, 1) for i in range(1, 11)]
+    await asyncio.gather(*(asyncio.create_task(dp.feed_update(bot, u)) for u in updates))
+    await bot.session.close()
+    return ordering.shed.get('callback_query', 'stale')
+
+
+async def cap_run(max_queued, total):
+    # total апдейтов одного чата за медленным обработчиком: сверх max_queued
+    # ожидающих отбрасываются сразу
+    dp = OrderedDispatcher(scheduler=ChatScheduler(max_queued=max_queued))
+    router = Router()
+
+    @router.message()
+    async def slow(msg):
+        await asyncio.sleep(0.05)
+
+    dp.include_router(router)
+    bot = Bot(token='42:BENCH')
+    await asyncio.gather(*(asyncio.create_task(dp.feed_update(bot, message(i, 1, 'x'))) for i in range(total)))
+    await bot.session.close()
+    return ordering.shed.get('message', 'chat_queue_full')
+
+
+async def hot_chat_run(limit, hot, others=20, delay=0.02):
+    # через WebhookServer: один чат присылает hot медленных апдейтов (больше
+    # лимита), следом по одному апдейту от others других чатов; их обработка
+    # не должна ждать, пока разберётся очередь горячего чата
+    dp = OrderedDispatcher(scheduler=ChatScheduler(limit, max_queued=0))
+    router = Router()
+    finished = {}
+
+    @router.message()
+    async def handle(msg):
+        if msg.chat.id == HOT_CHAT:
+            await asyncio.sleep(delay)
+        finished[msg.chat.id] = time.monotonic()
+
+    dp.include_router(router)
+    bot = Bot(token='42:BENCH')
+    server = WebhookServer(dp, bot)
+    runner = web.AppRunner(server.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', PORT).start()
+    url = f'http://127.0.0.1:{PORT}{WEBHOOK_PATH}'
+    async with aiohttp.ClientSession() as session:
+        async def post(update):
+            async with session.post(url, json=update) as resp:
+                assert resp.status == 200, resp.status
+
+        flood = asyncio.gather(*(post(raw_message(i, HOT_CHAT, 'hot')) for i in range(hot)))
+        await asyncio.sleep(0.2)
+        start = time.monotonic()
+        await asyncio.gather(*(post(raw_message(hot + i, HOT_CHAT + 1 + i, 'x')) for i in range(others)))
+        while sum(chat != HOT_CHAT for chat in finished) < others:
+            await asyncio.sleep(0.005)
+        waited = max(t for chat, t in finished.items() if chat != HOT_CHAT) - start
+        await flood
+    await server.drain()
+    await runner.cleanup()
+    await bot.session.close()
+    return waited, hot * delay
+
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_chat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    limit = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    random.seed(1)
+    variants = [
+        ('Dispatcher', Dispatcher),
+        (f'OrderedDispatcher (limit {limit})',
+         lambda: OrderedDispatcher(scheduler=ChatScheduler(limit, max_queued=0))),
+    ]
+    for name, factory in variants:
+        elapsed, overtaken, peak = asyncio.run(order_run(factory, chats, per_chat))
+        print(f'{name:32} {chats * per_chat} updates in {elapsed:.2f}s, '
+              f'out of order: {overtaken}, peak concurrency: {peak}')
+    print(f'stale callback queries dropped behind a 0.3 s handler (ttl 0.1 s): {asyncio.run(shed_run())} of 10')
+    print(f'updates dropped from a chat with 5 already queued: {asyncio.run(cap_run(5, 10))} of 10')
+    # в очереди горячего чата вдвое больше апдейтов, чем обработчиков может
+    # работать одновременно
+    hot = 2 * UPDATE_MAX_CONCURRENCY
+    waited, backlog = asyncio.run(hot_chat_run(UPDATE_MAX_CONCURRENCY, hot))
+    print(f'webhook: {hot} queued updates of one chat ({backlog:.1f} s of work), '
+          f'20 other chats handled in {waited * 1000:.0f} ms')
+    if waited > backlog / 10:
+        sys.exit('other chats waited for the hot chat')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Сколько чтений БД приходится на один апдейт с кэшем профилей и без него.
+# Апдейты проходят через Dispatcher с ProfileMiddleware; запросы к API Telegram
+# перехватывает фейковая сессия. Профили без города, чтобы не ходить за погодой.
+# Запуск: python bench/profile_reads.py [апдейтов] [пользователей]
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message, Update
+
+import _setup  # noqa: F401
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+from fsm_storage import create_storage  # noqa: E402
+from handlers import router  # noqa: E402
+from middlewares import ProfileMiddleware  # noqa: E402
+
+
+class FakeSession(BaseSession):
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=1, date=datetime.now(), text=method.text,
+                chat=Chat(id=method.chat_id, type='private'),
+            )
+        return True
+
+    async def stream_content(self, url, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def make_update(i, users):
+    uid = 1000 + i % users
+    user = {'id': uid, 'is_bot': False, 'first_name': 'Bench'}
+    chat = {'id': uid, 'type': 'private'}
+    message = {'message_id': i, 'date': int(time.time()), 'chat': chat, 'from': user}
+    kind = i % 4
+    if kind == 0:
+        return Update(update_id=i, message={**message, 'text': '/start'})
+    if kind == 1:
+        return Update(update_id=i, message={**message, 'text': '/check_progress'})
+    if kind == 2:
+        return Update(update_id=i, message={**message, 'text': '/recommend'})
+    return Update(update_id=i, callback_query={
+        'id': str(i), 'from': user, 'chat_instance': str(uid),
+        'message': {**message, 'text': 'menu'}, 'data': 'RC:foods',
+    })
+
+
+async def run(dp, bot, updates, users, cached):
+    async_db._profiles.clear()
+    # ttl=0: каждая запись сразу устаревает, т.е. кэш фактически выключен
+    async_db._profiles.ttl = async_db.PROFILE_CACHE_TTL if cached else 0
+    reads = async_db.stats['reads']
+    start = time.perf_counter()
+    for i in range(updates):
+        await dp.feed_update(bot, make_update(i, users))
+    elapsed = time.perf_counter() - start
+    reads = async_db.stats['reads'] - reads
+    return reads / updates, updates / elapsed
+
+
+async def run_all(updates, users):
+    bot = Bot(token='42:BENCH', session=FakeSession())
+    dp = Dispatcher(storage=create_storage())
+    dp.message.middleware(ProfileMiddleware())
+    dp.callback_query.middleware(ProfileMiddleware())
+    dp.include_router(router)
+    for cached in (False, True):
+        per_update, rate = await run(dp, bot, updates, users, cached)
+        label = 'cache on ' if cached else 'cache off'
+        print(f'{label}: {per_update:.2f} DB reads/update, {rate:.0f} updates/s')
+    await dp.emit_shutdown(bot=bot)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    db.init_db()
+    for uid in range(1000, 1000 + users):
+        db.create_or_update_user(
+            uid, weight=70, height=175, age=30, gender='м',
+            activity_level='med', goal='maint', city=None,
+        )
+    asyncio.run(run_all(updates, users))
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Пропускная способность многопроцессного режима: генератор синтетических
+# апдейтов (/help от 500 пользователей) раздаёт их через ShardRouter N
+# процессам-воркерам с обычным диспетчером из main.py и фейковой сессией
+# Telegram; печатается updates/s для каждого N. Прирост ограничен числом ядер.
+# Запуск: python bench/sharding.py [апдейтов] [N через запятую]
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+import _setup  # noqa: F401
+os.environ['METRICS_ENABLED'] = '0'
+os.environ['LOGGING_LEVEL'] = 'WARNING'
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+from aiogram.types import Chat, Message  # noqa: E402
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+from main import create_dispatcher  # noqa: E402
+from sharding import ShardRouter  # noqa: E402
+
+USERS = 500
+
+
+class FakeSession(BaseSession):
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            return Message(message_id=1, date=datetime.now(), text=method.text,
+                           chat=Chat(id=method.chat_id, type='private'))
+        return True
+
+    async def stream_content(self, url, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def fake_bot():
+    return Bot(token='42:BENCH', session=FakeSession())
+
+
+def make_update(i):
+    uid = 1000 + i % USERS
+    return {
+        'update_id': i,
+        'message': {
+            'message_id': i,
+            'date': int(time.time()),
+            'chat': {'id': uid, 'type': 'private'},
+            'from': {'id': uid, 'is_bot': False, 'first_name': 'Bench'},
+            'text': '/help',
+        },
+    }
+
+
+async def wait_processed(router, count):
+    while sum(v.value for v in router.processed) < count:
+        await asyncio.sleep(0.005)
+
+
+async def run(workers, total):
+    router = ShardRouter(workers, create_dispatcher, fake_bot)
+    router.start()
+    bot = fake_bot()
+    # прогрев: воркеры запущены и обработали по апдейту каждого пользователя
+    for i in range(USERS):
+        await router.feed_raw_update(bot, make_update(i))
+    await wait_processed(router, USERS)
+    start = time.perf_counter()
+    for i in range(USERS, USERS + total):
+        await router.feed_raw_update(bot, make_update(i))
+    await wait_processed(router, USERS + total)
+    elapsed = time.perf_counter() - start
+    await router.stop()
+    return elapsed
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    counts = [int(n) for n in sys.argv[2].split(',')] if len(sys.argv) > 2 else [1, 2, 4]
+    db.init_db()
+    async_db.shutdown()
+    print(f'CPU cores: {os.cpu_count()}')
+    base = None
+    for workers in counts:
+        elapsed = asyncio.run(run(workers, total))
+        rate = total / elapsed
+        base = base or rate
+        print(f'N={workers}: {total} updates in {elapsed:.2f}s ({rate:.0f} updates/s, x{rate / base:.2f})')
+
+
+if __name__ == '__main__':
+    main()
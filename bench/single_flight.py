@@ -0,0 +1,84 @@
+# Склейка одновременных запросов: N одинаковых вызовов get_temperature и
+# get_product_calories разом против локальной заглушки с задержкой. Проверяет,
+# что до заглушки дошло ровно по одному запросу на API (иначе выход с ошибкой),
+# и для сравнения печатает, сколько запросов ушло бы без SingleFlight.
+# Запуск: python bench/single_flight.py [N] [задержка_сек]
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import web
+
+import _setup  # noqa: F401
+
+PORT = 8767
+os.environ['OPENWEATHER_API_URL'] = f'http://127.0.0.1:{PORT}/data/2.5'
+os.environ['USDA_API_URL'] = f'http://127.0.0.1:{PORT}/fdc/v1'
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+import http_client  # noqa: E402
+import nutrition_api  # noqa: E402
+import weather_api  # noqa: E402
+
+
+def make_app(latency, hits):
+    async def weather(request):
+        hits['weather'] += 1
+        await asyncio.sleep(latency)
+        return web.json_response({'cod': 200, 'main': {'temp': 31.0}, 'timezone': 10800})
+
+    async def foods(request):
+        hits['nutrition'] += 1
+        await asyncio.sleep(latency)
+        return web.json_response({'foods': [{'foodNutrients': [{'nutrientId': 1008, 'value': 89}]}]})
+
+    app = web.Application()
+    app.router.add_get('/data/2.5/weather', weather)
+    app.router.add_get('/fdc/v1/foods/search', foods)
+    return app
+
+
+async def burst(name, n, call, hits):
+    hits[name] = 0
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call() for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    assert len(set(results)) == 1 and results[0] is not None, set(results)
+    print(f'{name:10} {n} concurrent lookups in {elapsed * 1000:.0f} ms, upstream hits: {hits[name]}')
+    return hits[name]
+
+
+async def run(n, latency):
+    hits = {'weather': 0, 'nutrition': 0}
+    runner = web.AppRunner(make_app(latency, hits))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', PORT).start()
+    try:
+        coalesced = [
+            await burst('weather', n, lambda: weather_api.get_temperature('Москва'), hits),
+            await burst('nutrition', n, lambda: nutrition_api.get_product_calories('banana'), hits),
+        ]
+        # без склейки: те же промахи, но каждый вызывает источник сам
+        print('without single-flight:')
+        await burst('weather', n, lambda: weather_api._fetch_weather('Казань'), hits)
+        await burst('nutrition', n, lambda: nutrition_api._fetch_calories('apple'), hits)
+    finally:
+        await http_client.close()
+        await runner.cleanup()
+    return coalesced
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    db.init_db()
+    coalesced = asyncio.run(run(n, latency))
+    async_db.shutdown()
+    if coalesced != [1, 1]:
+        sys.exit(f'expected one upstream hit per API, got {coalesced}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# Время старта бота: отчёт python -X importtime для `import main` и время от
+# запуска процесса до обработки первого апдейта (/help через Dispatcher с
+# фейковой сессией Telegram). Вариант eager заранее импортирует matplotlib и
+# googletrans, как это делали charts.py и translator.py до ленивой загрузки.
+# Запуск: python bench/startup.py [повторов]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import _setup
+
+ROOT = _setup.ROOT
+EAGER = 'import matplotlib.dates, matplotlib.figure, matplotlib.backends.backend_agg, googletrans'
+TOP = 8
+
+
+def child(eager):
+    # выполняется в отдельном процессе: импорт, как в main.py, и один апдейт
+    if eager:
+        exec(EAGER)
+    import asyncio
+    from datetime import datetime
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import SendMessage
+    from aiogram.types import Chat, Message, Update
+
+    import main
+    import db
+
+    class FakeSession(BaseSession):
+        async def make_request(self, bot, method, timeout=None):
+            if isinstance(method, SendMessage):
+                return Message(message_id=1, date=datetime.now(), text=method.text,
+                               chat=Chat(id=method.chat_id, type='private'))
+            return True
+
+        async def stream_content(self, url, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b''
+
+        async def close(self):
+            pass
+
+    async def first_update():
+        db.init_db()
+        dp = Dispatcher(storage=main.create_storage())
+        dp.message.middleware(main.ProfileMiddleware())
+        dp.include_router(main.router)
+        user = {'id': 1, 'is_bot': False, 'first_name': 'Bench'}
+        await dp.feed_update(Bot(token='42:BENCH', session=FakeSession()), Update(update_id=1, message={
+            'message_id': 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'},
+            'from': user, 'text': '/help',
+        }))
+        print(time.time(), flush=True)
+        os._exit(0)
+
+    asyncio.run(first_update())
+
+
+def env():
+    # у каждого запуска своя пустая БД: миграции входят во время старта
+    workdir = tempfile.mkdtemp(dir=_setup.WORKDIR)
+    return {**os.environ, 'BENCH_WORKDIR': workdir, 'DB_NAME': os.path.join(workdir, 'bench.db'),
+            'METRICS_ENABLED': '0', 'PYTHONDONTWRITEBYTECODE': '1'}
+
+
+def import_report(eager):
+    code = (EAGER + '; ' if eager else '') + 'import main'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, env=env(), capture_output=True, text=True, check=True)
+    total = 0.0
+    top = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # отступ: один пробел у модулей верхнего уровня, +2 на каждый уровень вложенности
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        ms = int(cumulative) / 1000
+        if level == 0:
+            total += ms
+        # сам main не показываем — интереснее, из чего он складывается
+        if level <= 1 and name.strip() != 'main':
+            top.append((ms, name.strip()))
+    return total, sorted(top, reverse=True)[:TOP]
+
+
+def time_to_first_update(eager):
+    start = time.time()
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'] + (['eager'] if eager else []),
+                         cwd=ROOT, env=env(), capture_output=True, text=True, check=True).stdout
+    return float(out.split()[-1]) - start
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2:3] == ['eager'])
+        return
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for eager in (True, False):
+        label = 'eager' if eager else 'lazy'
+        total, top = import_report(eager)
+        print(f'{label}: imports {total:.0f} ms; largest:')
+        for ms, name in top:
+            print(f'    {ms:8.1f} ms  {name}')
+        ttfu = [time_to_first_update(eager) for _ in range(repeats)]
+        print(f'{label}: time to first update {statistics.median(ttfu) * 1000:.0f} ms '
+              f'(median of {repeats}, includes interpreter start)')
+
+
+if __name__ == '__main__':
+    main()
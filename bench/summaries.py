@@ -0,0 +1,129 @@
+# Рассылка вечерних сводок фейковому боту, который записывает время каждой
+# отправки и на одном из сообщений отвечает flood wait (429 retry_after).
+# Проверяет, что в любом окне в 1 с не больше rate сообщений, что в один чат
+# не уходит больше одной сводки и что повторный проход ничего не отправляет;
+# затем — что итоги в сводке города с ненулевым смещением от UTC считаются
+# за его местный день.
+# Города заранее кладутся в кэш погоды, чтобы не ходить в OpenWeatherMap.
+# Запуск: python bench/summaries.py [пользователей] [сообщений_в_секунду]
+import asyncio
+import bisect
+import logging
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import _setup  # noqa: F401
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+import weather_api  # noqa: E402
+from summaries import SummaryScheduler  # noqa: E402
+
+HOUR = 20
+FLOOD_AT = 50
+FLOOD_WAIT = 1
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self._flooded = False
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0.02)
+        if len(self.sent) == FLOOD_AT and not self._flooded:
+            self._flooded = True
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), 'Too Many Requests', FLOOD_WAIT)
+        self.sent.append((time.monotonic(), chat_id))
+
+
+def offset_for(local_hour, utc_hour):
+    h = (local_hour - utc_hour) % 24
+    return (h if h <= 14 else h - 24) * 3600
+
+
+def city_offsets():
+    # смещения от UTC, при которых у города сейчас вечер (час >= HOUR);
+    # в последнем городе сейчас утро, и сводки ему не положены
+    utc_hour = datetime.now(timezone.utc).hour
+    offsets = {f'Город{k}': offset_for(HOUR + k, utc_hour) for k in range(3)}
+    offsets['Утро'] = offset_for(HOUR - 10, utc_hour)
+    return offsets
+
+
+def max_per_window(times, window=1.0):
+    return max(bisect.bisect_left(times, t + window) - i for i, t in enumerate(times))
+
+
+async def run(users, rate):
+    offsets = city_offsets()
+    for city, offset in offsets.items():
+        weather_api._tz_cache.set(weather_api._city_key(city), offset)
+        weather_api._temp_cache.set(weather_api._city_key(city), 28.0)
+    cities = list(offsets)
+    db.create_or_update_users([
+        dict(user_id=uid, weight=60 + uid % 40, height=170, age=30, gender='ж',
+             activity_level='med', goal='loss', city=cities[uid % len(cities)])
+        for uid in range(1, users + 1)
+    ])
+    due = sum(
+        1 for uid in range(1, users + 1)
+        if (datetime.now(timezone.utc) + timedelta(seconds=offsets[cities[uid % len(cities)]])).hour >= HOUR
+    )
+
+    bot = FakeBot()
+    scheduler = SummaryScheduler(bot, hour=HOUR, rate=rate, chat_interval=1.0, concurrency=20)
+    start = time.monotonic()
+    sent = await scheduler.run_once()
+    elapsed = time.monotonic() - start
+    times = [t for t, _ in bot.sent]
+    print(f'{sent} summaries ({due} due of {users} users) in {elapsed:.1f}s, '
+          f'{sent / elapsed:.1f} msg/s at rate {rate:g}/s')
+    print(f'max messages in any 1s window: {max_per_window(times)}, '
+          f'max per chat: {max(Counter(c for _, c in bot.sent).values())}, stats: {scheduler.stats}')
+    again = await scheduler.run_once()
+    print(f'second pass sent {again} summaries')
+    assert sent == due and again == 0
+    assert max_per_window(times) <= rate
+    await local_day_check(scheduler, users + 1)
+
+
+async def local_day_check(scheduler, uid):
+    # итоги сводки — за местный день города с ненулевым смещением: логи за минуту
+    # до местной полуночи и ровно в следующую полночь в сумму не входят
+    utc_hour = datetime.now(timezone.utc).hour
+    offset = next(o for o in (offset_for(HOUR + k, utc_hour) for k in range(4)) if o)
+    city = 'Смещение'
+    weather_api._tz_cache.set(weather_api._city_key(city), offset)
+    db.create_or_update_users([dict(user_id=uid, weight=70, height=170, age=30, gender='ж',
+                                    activity_level='med', goal='loss', city=city)])
+    day = (datetime.now(timezone.utc) + timedelta(seconds=offset)).strftime('%Y-%m-%d')
+    midnight = datetime.fromisoformat(day) - timedelta(seconds=offset)
+    logs = [(-1, 500), (1, 300), (24 * 60, 700)]
+    db.write_logs([
+        ('water', (uid, amount, (midnight + timedelta(minutes=m)).strftime('%Y-%m-%d %H:%M:%S')))
+        for m, amount in logs
+    ])
+    due = {key: cities for key, cities in (await scheduler.due_days()).items() if city in cities}
+    assert list(due) == [(day, offset)], due
+    rows = await async_db.get_summary_candidates([city], day, offset)
+    print(f'local day {day} at UTC{offset / 3600:+g}: water in summary {rows[0][8]} ml (expected 300)')
+    assert rows[0][8] == 300
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    db.init_db()
+    asyncio.run(run(users, rate))
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Нагрузка на webhook-сервер: синтетические апдейты Telegram (JSON) отправляются
+# POST-запросами на локальный сервер, печатается updates/sec и время «дренажа»
+# при остановке. Апдейты — обычный текст без состояния, поэтому обработчики
+# не обращаются к API Telegram.
+# Запуск: python bench/webhook_load.py [апдейтов] [параллельных_запросов]
+import asyncio
+import logging
+import sys
+import time
+
+import aiohttp
+
+import _setup  # noqa: F401
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+
+import async_db  # noqa: E402
+import db  # noqa: E402
+from fsm_storage import create_storage  # noqa: E402
+from handlers import router  # noqa: E402
+from webhook import WebhookServer  # noqa: E402
+
+PORT = 8766
+
+
+def make_update(i):
+    uid = 1000 + i % 500
+    return {
+        'update_id': i,
+        'message': {
+            'message_id': i,
+            'date': int(time.time()),
+            'chat': {'id': uid, 'type': 'private'},
+            'from': {'id': uid, 'is_bot': False, 'first_name': 'Bench'},
+            'text': 'привет',
+        },
+    }
+
+
+async def run(total, concurrency):
+    db.init_db()
+    bot = Bot(token='42:BENCH')
+    dp = Dispatcher(storage=create_storage())
+    dp.include_router(router)
+    server = WebhookServer(dp, bot)
+    runner = aiohttp.web.AppRunner(server.make_app())
+    await runner.setup()
+    await aiohttp.web.TCPSite(runner, '127.0.0.1', PORT).start()
+    url = f'http://127.0.0.1:{PORT}/webhook'
+
+    counter = iter(range(total))
+
+    async def client(session):
+        for i in counter:
+            async with session.post(url, json=make_update(i)) as resp:
+                assert resp.status == 200, resp.status
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    accepted = time.perf_counter() - start
+    await server.drain()
+    done = time.perf_counter() - start
+    await runner.cleanup()
+    await dp.emit_shutdown(bot=bot)
+    await bot.session.close()
+    print(f'accepted {total} updates in {accepted:.2f}s ({total / accepted:.0f} updates/s)')
+    print(f'processed {server.processed} updates in {done:.2f}s ({server.processed / done:.0f} updates/s)')
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(run(total, concurrency))
+    async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
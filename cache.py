@@ -0,0 +1,86 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# маркер отсутствия значения: позволяет кэшировать None (отрицательное кэширование)
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is not None:
+            value, expires_at = item
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._data),
+        }
+
+
+class SingleFlight:
+    # Одновременные вызовы do(key, fn, ...) с одним ключом делят один запуск
+    # fn: первый вызов запускает его задачей, остальные ждут ту же задачу и
+    # получают её результат или исключение. Ключ освобождается, как только
+    # задача завершилась, так что следующий промах снова идёт к источнику.
+    # Задача защищена от отмены: если отменят вызвавшего первым, остальные
+    # всё равно дождутся ответа.
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._tasks = {}
+
+    async def do(self, key, fn, *args):
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = self._tasks[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # исключение забирают ожидающие; без них — не пишем «never retrieved»
+            task.exception()
+
+    def stats(self):
+        return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._tasks)}
@@ -0,0 +1,172 @@
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from io import BytesIO
+
+from config import CHART_WORKERS, CHART_MAX_PENDING, CHART_MAX_WAITING, CHART_CACHE_BYTES
+
+SERIES = (
+    ('Вода (мл)', 'blue'),
+    ('Потреблённые ккал', 'red'),
+    ('Сожжённые ккал', 'green'),
+)
+
+_executor = None
+_slots = asyncio.Semaphore(CHART_MAX_PENDING)
+_waiting = 0
+
+
+class ChartQueueFull(Exception):
+    pass
+
+
+@dataclass
+class CachedChart:
+    day: str
+    png: bytes
+    file_id: str = None
+
+
+class ChartCache:
+    # готовые графики по (user_id, окно); запись действительна только для того
+    # локального дня, в который построена, и сбрасывается при новой записи в логи
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.uploads_saved = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+
+    def generation(self, user_id):
+        return self._generations.get(user_id, 0)
+
+    def get(self, user_id, window, day):
+        entry = self._entries.get((user_id, window))
+        if entry is None or entry.day != day:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((user_id, window))
+        self.hits += 1
+        if entry.file_id:
+            self.uploads_saved += 1
+        self.bytes_saved += len(entry.png)
+        return entry
+
+    def put(self, user_id, window, day, png, generation):
+        # generation берётся до чтения данных: если за время рендеринга пользователь
+        # что-то записал, график уже устарел и в кэш не попадает
+        if generation != self.generation(user_id):
+            return
+        self._remove((user_id, window))
+        self._entries[(user_id, window)] = CachedChart(day, png)
+        self.size += len(png)
+        while self.size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.png)
+
+    def set_file_id(self, user_id, window, day, file_id):
+        entry = self._entries.get((user_id, window))
+        if entry is not None and entry.day == day:
+            entry.file_id = file_id
+
+    def invalidate(self, user_id):
+        self._generations[user_id] = self.generation(user_id) + 1
+        for key in [key for key in self._entries if key[0] == user_id]:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.png)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'bytes_saved': self.bytes_saved,
+            'uploads_saved': self.uploads_saved,
+        }
+
+
+chart_cache = ChartCache(CHART_CACHE_BYTES)
+
+
+def render_chart(days, water, eaten, burned):
+    # выполняется в процессе-воркере; pyplot не используется, фигура целиком локальна.
+    # matplotlib импортируется здесь, чтобы бот не загружал его при старте
+    import matplotlib.dates as mdates
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    days_dt = [datetime.strptime(day, '%Y-%m-%d') for day in days]
+    fig = Figure(figsize=(6, 10))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(nrows=3, ncols=1)
+    for ax, values, (title, color) in zip(axes, (water, eaten, burned), SERIES):
+        ax.plot(days_dt, values, marker='o', color=color)
+        ax.set_title(f'{title} за {len(days)} дней')
+        ax.grid(True)
+        ax.tick_params(axis='x', rotation=45)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
+    fig.tight_layout()
+    bio = BytesIO()
+    fig.savefig(bio, format='png')
+    return bio.getvalue()
+
+
+def _warm_up():
+    # пустой график: импорт matplotlib и загрузка шрифтов в воркере
+    render_chart(['2000-01-01'], [0], [0], [0])
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: к этому моменту в процессе уже работают потоки БД,
+        # переводчика и логирования, и fork скопировал бы их захваченные блокировки,
+        # кэши и соединения; воркеру же нужен только этот модуль
+        _executor = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+async def render_daily_totals(rows):
+    # rows — результат get_daily_totals: (день, вода, съедено, сожжено).
+    # В работе не больше CHART_MAX_PENDING графиков, остальные ждут слота;
+    # если ждущих уже CHART_MAX_WAITING, запрос отклоняется
+    global _waiting
+    if _waiting >= CHART_MAX_WAITING:
+        raise ChartQueueFull()
+    days, water, eaten, burned = (list(column) for column in zip(*rows))
+    _waiting += 1
+    try:
+        await _slots.acquire()
+    finally:
+        _waiting -= 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), render_chart, days, water, eaten, burned)
+    finally:
+        _slots.release()
+
+
+async def prewarm():
+    # запускает воркеры и загружает в них matplotlib заранее, чтобы первый
+    # /show_charts не ждал импорта; слоты рендеринга не занимает
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    await asyncio.gather(*(loop.run_in_executor(executor, _warm_up) for _ in range(CHART_WORKERS)))
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -10,3 +10,141 @@ OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
 USDA_API_KEY = os.getenv('USDA_API_KEY')
 
 DB_NAME = os.getenv('DB_NAME', '/app/bot_database.db')
+
+# базовые адреса внешних API (можно подменить локальной заглушкой)
+OPENWEATHER_API_URL = os.getenv('OPENWEATHER_API_URL', 'http://api.openweathermap.org/data/2.5')
+USDA_API_URL = os.getenv('USDA_API_URL', 'https://api.nal.usda.gov/fdc/v1')
+
+# общий HTTP-клиент: таймаут запроса (с), повторы с экспоненциальной задержкой, лимиты соединений
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '5'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.3'))
+HTTP_CONN_LIMIT = int(os.getenv('HTTP_CONN_LIMIT', '100'))
+HTTP_CONN_PER_HOST = int(os.getenv('HTTP_CONN_PER_HOST', '20'))
+
+# кэш погоды по городу: температура и часовой пояс берутся из одного ответа /weather
+WEATHER_TEMP_TTL = int(os.getenv('WEATHER_TEMP_TTL', '600'))
+WEATHER_TZ_TTL = int(os.getenv('WEATHER_TZ_TTL', '86400'))
+WEATHER_CACHE_SIZE = int(os.getenv('WEATHER_CACHE_SIZE', '1000'))
+
+# параметры SQLite-соединений (одно долгоживущее соединение на поток)
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5'))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', '-16000'))  # отрицательное значение — размер в КиБ
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.getenv('DB_STATEMENT_CACHE', '128'))
+
+# число потоков для чтения из БД (запись всегда идёт через один поток)
+DB_READ_THREADS = int(os.getenv('DB_READ_THREADS', '4'))
+
+# запись логов воды/еды/тренировок: 'sync' — каждая запись своей транзакцией;
+# 'group' — пачками, обработчик ждёт коммита своей пачки; 'behind' — пачками
+# без ожидания, раз в LOG_FLUSH_MS миллисекунд (при падении процесса теряется
+# не больше чем за этот интервал). Пачка не больше LOG_FLUSH_ROWS записей
+LOG_WRITE_MODE = os.getenv('LOG_WRITE_MODE', 'sync')
+LOG_FLUSH_MS = int(os.getenv('LOG_FLUSH_MS', '50'))
+LOG_FLUSH_ROWS = int(os.getenv('LOG_FLUSH_ROWS', '200'))
+
+# выгрузка/загрузка логов (/export, manage.py export-logs/import-logs):
+# сколько строк читать из курсора за раз и сколько строк писать одной транзакцией
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '1000'))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '50000'))
+
+# кэш калорийности продуктов: срок годности найденных значений и промахов (с),
+# размер и TTL LRU в памяти процесса; сохранять ли ручной ввод пользователя
+NUTRITION_TTL = int(os.getenv('NUTRITION_TTL', str(30 * 86400)))
+NUTRITION_NEGATIVE_TTL = int(os.getenv('NUTRITION_NEGATIVE_TTL', '86400'))
+NUTRITION_CACHE_SIZE = int(os.getenv('NUTRITION_CACHE_SIZE', '2000'))
+NUTRITION_LRU_TTL = int(os.getenv('NUTRITION_LRU_TTL', '3600'))
+NUTRITION_SAVE_MANUAL = os.getenv('NUTRITION_SAVE_MANUAL', '1') == '1'
+
+# размер LRU переводов названий продуктов в памяти процесса
+TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', '2000'))
+
+# рендеринг графиков: число процессов, сколько графиков может быть в работе
+# одновременно и сколько запросов может ждать своей очереди
+CHART_WORKERS = int(os.getenv('CHART_WORKERS', '2'))
+CHART_MAX_PENDING = int(os.getenv('CHART_MAX_PENDING', '4'))
+CHART_MAX_WAITING = int(os.getenv('CHART_MAX_WAITING', '32'))
+# сколько байт готовых PNG-графиков держать в памяти
+CHART_CACHE_BYTES = int(os.getenv('CHART_CACHE_BYTES', str(32 * 1024 * 1024)))
+# повторно отправлять закэшированный график по file_id Telegram вместо загрузки файла
+CHART_REUSE_FILE_ID = os.getenv('CHART_REUSE_FILE_ID', '1') == '1'
+
+# загрузить matplotlib в процессы графиков и googletrans в поток переводчика
+# сразу после старта (в фоне), а не при первом /show_charts или переводе
+PREWARM = os.getenv('PREWARM', '0') == '1'
+
+# хранилище FSM: 'sqlite' (переживает перезапуск) или 'memory';
+# как часто сбрасывать накопленные изменения в БД (с) и через сколько
+# секунд бездействия брошенный диалог считается истёкшим
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite')
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '0.5'))
+FSM_TTL = int(os.getenv('FSM_TTL', str(24 * 3600)))
+
+# обработка апдейтов: апдейты одного чата — по очереди, всего одновременно
+# не больше UPDATE_MAX_CONCURRENCY; нажатие кнопки, прождавшее в очереди
+# дольше CALLBACK_STALE_AFTER секунд, отбрасывается (0 — никогда); апдейт чата,
+# в очереди которого уже CHAT_QUEUE_LIMIT апдейтов, отбрасывается (0 — без предела)
+UPDATE_MAX_CONCURRENCY = int(os.getenv('UPDATE_MAX_CONCURRENCY', '100'))
+CALLBACK_STALE_AFTER = float(os.getenv('CALLBACK_STALE_AFTER', '10'))
+CHAT_QUEUE_LIMIT = int(os.getenv('CHAT_QUEUE_LIMIT', '20'))
+
+# режим получения апдейтов: 'polling' или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# webhook: публичный адрес (если задан, регистрируется в Telegram при старте),
+# путь и адрес локального сервера, секрет из заголовка X-Telegram-Bot-Api-Secret-Token,
+# сколько одновременных соединений разрешить Telegram (max_connections) и сколько
+# ждать завершения начатых апдейтов при остановке (с). Апдейт подтверждается
+# сразу и ждёт в фоновой задаче: число одновременно работающих обработчиков
+# задаёт UPDATE_MAX_CONCURRENCY, а число фоновых задач общим пределом не
+# ограничено — только на чат, CHAT_QUEUE_LIMIT
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '100'))
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv('WEBHOOK_SHUTDOWN_TIMEOUT', '30'))
+
+# несколько процессов: 0 — всё в одном процессе; N — супервизор получает апдейты
+# (polling или webhook) и раздаёт их N процессам-воркерам по user_id;
+# сколько апдейтов может ждать в очереди воркера, сколько держать в работе
+# в каждом воркере и сколько ждать их завершения при остановке (с).
+# Метрики воркера i — на порту METRICS_PORT + 1 + i
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0'))
+SHARD_QUEUE_SIZE = int(os.getenv('SHARD_QUEUE_SIZE', '1000'))
+SHARD_MAX_CONCURRENCY = int(os.getenv('SHARD_MAX_CONCURRENCY', '100'))
+SHARD_SHUTDOWN_TIMEOUT = float(os.getenv('SHARD_SHUTDOWN_TIMEOUT', '30'))
+
+# журнал событий: уровень, формат ('text' или 'jsonl'), файл (пусто — stderr);
+# какая доля записей каждого уровня пишется ('INFO:0.1,DEBUG:0', по умолчанию все)
+# и сколько записей в секунду на уровень ниже WARNING (0 — без ограничения).
+# Записи форматируются и пишутся в фоновом потоке
+LOGGING_LEVEL = os.getenv('LOGGING_LEVEL', 'INFO')
+LOGGING_FORMAT = os.getenv('LOGGING_FORMAT', 'text')
+LOGGING_FILE = os.getenv('LOGGING_FILE', '')
+LOGGING_SAMPLING = os.getenv('LOGGING_SAMPLING', '')
+LOGGING_RATE_LIMIT = float(os.getenv('LOGGING_RATE_LIMIT', '200'))
+
+# метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+
+# кэш профилей пользователей (write-through)
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '10000'))
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', '3600'))
+
+# вечерняя сводка за день: в котором часу по местному времени города пользователя
+# её отправлять, как часто проверять, кому пора (с), сколько сообщений в секунду
+# отправлять всего (у Telegram лимит около 30) и не чаще чем раз в сколько секунд
+# писать в один чат, сколько отправок держать в работе и сколько раз повторять
+# сообщение после flood wait (429 retry_after)
+SUMMARY_ENABLED = os.getenv('SUMMARY_ENABLED', '1') == '1'
+SUMMARY_HOUR = int(os.getenv('SUMMARY_HOUR', '21'))
+SUMMARY_CHECK_INTERVAL = float(os.getenv('SUMMARY_CHECK_INTERVAL', '60'))
+SUMMARY_RATE = float(os.getenv('SUMMARY_RATE', '25'))
+SUMMARY_CHAT_INTERVAL = float(os.getenv('SUMMARY_CHAT_INTERVAL', '1'))
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '10'))
+SUMMARY_RETRIES = int(os.getenv('SUMMARY_RETRIES', '3'))
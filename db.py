@@ -1,8 +1,150 @@
 import sqlite3
-from config import DB_NAME
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
+from config import (
+    DB_NAME,
+    DB_BUSY_TIMEOUT,
+    DB_SYNCHRONOUS,
+    DB_CACHE_SIZE,
+    DB_MMAP_SIZE,
+    DB_STATEMENT_CACHE
+)
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+
+# суммы по (user_id, день), посчитанные по сырым логам; {where} — фильтр,
+# который подставляется в каждую из трёх таблиц. В старых логах значения
+# могут быть NULL, а колонки daily_totals — NOT NULL, поэтому COALESCE
+RAW_DAILY_SQL = '''
+    SELECT user_id, date(timestamp) AS day,
+           COALESCE(SUM(water), 0), COALESCE(SUM(eaten), 0), COALESCE(SUM(burned), 0) FROM (
+        SELECT user_id, timestamp, amount AS water, 0 AS eaten, 0 AS burned FROM water_logs {where}
+        UNION ALL
+        SELECT user_id, timestamp, 0, calories, 0 FROM food_logs {where}
+        UNION ALL
+        SELECT user_id, timestamp, 0, 0, calories_burned FROM workout_logs {where}
+    )
+    GROUP BY user_id, day
+'''
+
+REBUILD_DAILY_TOTALS_SQL = (
+    'INSERT INTO daily_totals (user_id, day, water_ml, kcal_in, kcal_out)'
+    + RAW_DAILY_SQL.format(where='')
+)
+
+# миграции схемы: номер миграции = индекс + 1, текущая версия хранится в PRAGMA user_version
+MIGRATIONS = [
+    [
+        'CREATE INDEX IF NOT EXISTS idx_water_logs_user_ts ON water_logs (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_food_logs_user_ts ON food_logs (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_workout_logs_user_ts ON workout_logs (user_id, timestamp)',
+    ],
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            water_ml REAL NOT NULL DEFAULT 0,
+            kcal_in REAL NOT NULL DEFAULT 0,
+            kcal_out REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        ''',
+        REBUILD_DAILY_TOTALS_SQL,
+    ],
+    [
+        # user_id = 0 — общий кэш USDA, иначе — ручное значение конкретного пользователя;
+        # kcal_100g = NULL — продукт не найден (отрицательное кэширование)
+        '''
+        CREATE TABLE IF NOT EXISTS product_cache (
+            user_id INTEGER NOT NULL DEFAULT 0,
+            name TEXT NOT NULL,
+            kcal_100g REAL,
+            source TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (user_id, name)
+        ) WITHOUT ROWID
+        ''',
+    ],
+    [
+        # переводы названий продуктов ru -> en
+        '''
+        CREATE TABLE IF NOT EXISTS translations (
+            text TEXT PRIMARY KEY,
+            translated TEXT NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ],
+    [
+        # состояния FSM: key = 'bot:chat:user[:destiny]', data — компактный JSON
+        '''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)',
+    ],
+    [
+        # за какой локальный день пользователю последний раз отправлена вечерняя сводка
+        '''
+        CREATE TABLE IF NOT EXISTS summary_log (
+            user_id INTEGER PRIMARY KEY,
+            day TEXT NOT NULL
+        )
+        ''',
+    ],
+]
+
+
+def _connect():
+    conn = sqlite3.connect(
+        DB_NAME,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=DB_STATEMENT_CACHE,
+        check_same_thread=False
+    )
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size={DB_CACHE_SIZE}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+def get_connection():
+    # соединение живёт всё время работы потока, поэтому кэш страниц и
+    # подготовленные выражения (cached_statements) переиспользуются между вызовами
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.generation != _generation:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def close_connections():
+    global _generation
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+        _generation += 1
+
 
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -45,66 +187,351 @@ def init_db():
         )
     ''')
     conn.commit()
-    conn.close()
+    migrate(conn)
+
+
+def migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        with conn:
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f'PRAGMA user_version={number}')
+
+
+def day_range(day: str, days: int = 1, offset: int = 0):
+    # полуинтервал [day, day + days): timestamp хранится как 'YYYY-MM-DD HH:MM:SS',
+    # поэтому сравнение строк попадает в индекс (user_id, timestamp);
+    # offset — смещение местного времени от UTC (с), тогда day — местная дата,
+    # а границы переводятся в UTC, в котором записаны логи
+    end = date.fromisoformat(day) + timedelta(days=days)
+    if not offset:
+        return day, end.isoformat()
+    shift = timedelta(seconds=offset)
+    start = datetime.fromisoformat(day) - shift
+    end = datetime.fromisoformat(end.isoformat()) - shift
+    return start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')
+
+
+@dataclass(frozen=True)
+class Profile:
+    user_id: int
+    weight: float
+    height: float
+    age: int
+    gender: str
+    activity_level: str
+    goal: str
+    city: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row[:8]) if row else None
 
 
 def get_user_data(user_id: int):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM users WHERE user_id=?', (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    conn = get_connection()
+    return conn.execute('SELECT * FROM users WHERE user_id=?', (user_id,)).fetchone()
+
+
+USER_COLUMNS = ('weight', 'height', 'age', 'gender', 'activity_level', 'goal', 'city')
+
+
+def _user_columns(fields):
+    unknown = set(fields) - set(USER_COLUMNS)
+    if unknown:
+        raise ValueError(f'unknown user columns: {sorted(unknown)}')
+    return tuple(c for c in USER_COLUMNS if c in fields)
+
+
+@lru_cache(maxsize=None)
+def _upsert_user_sql(columns):
+    # одна строка SQL на набор колонок (их не больше 2**7), имена только из USER_COLUMNS
+    names = ', '.join(('user_id', *columns))
+    marks = ', '.join('?' * (len(columns) + 1))
+    if not columns:
+        return f'INSERT INTO users ({names}) VALUES ({marks}) ON CONFLICT (user_id) DO NOTHING'
+    sets = ', '.join(f'{c} = excluded.{c}' for c in columns)
+    return f'INSERT INTO users ({names}) VALUES ({marks}) ON CONFLICT (user_id) DO UPDATE SET {sets}'
 
 
 def create_or_update_user(user_id: int, **kwargs):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('SELECT user_id FROM users WHERE user_id=?', (user_id,))
-    existing = cur.fetchone()
-    if existing:
-        sets = []
-        vals = []
-        for k, v in kwargs.items():
-            sets.append(f'{k}=?')
-            vals.append(v)
-        vals.append(user_id)
-        sql = f"UPDATE users SET {','.join(sets)} WHERE user_id=?"
-        cur.execute(sql, tuple(vals))
-    else:
-        cols = list(kwargs.keys())
-        vals = list(kwargs.values())
-        sql = f"INSERT INTO users (user_id, {','.join(cols)}) VALUES ({','.join(['?']*(len(cols)+1))})"
-        cur.execute(sql, (user_id, *vals))
-    conn.commit()
-    conn.close()
+    columns = _user_columns(kwargs)
+    conn = get_connection()
+    with conn:
+        conn.execute(_upsert_user_sql(columns), (user_id, *(kwargs[c] for c in columns)))
+
+
+def create_or_update_users(profiles):
+    # массовый вариант: profiles — словари с user_id и колонками профиля;
+    # профили с одинаковым набором колонок пишутся одним executemany
+    groups = {}
+    for profile in profiles:
+        fields = dict(profile)
+        user_id = fields.pop('user_id')
+        columns = _user_columns(fields)
+        groups.setdefault(columns, []).append((user_id, *(fields[c] for c in columns)))
+    conn = get_connection()
+    with conn:
+        for columns, rows in groups.items():
+            conn.executemany(_upsert_user_sql(columns), rows)
+    return sum(len(rows) for rows in groups.values())
+
+
+def save_user(user_id: int, **kwargs):
+    # запись и чтение итогового профиля одним запросом (для write-through кэша)
+    columns = _user_columns(kwargs)
+    sql = _upsert_user_sql(columns) + ' RETURNING *'
+    conn = get_connection()
+    with conn:
+        row = conn.execute(sql, (user_id, *(kwargs[c] for c in columns))).fetchone()
+    # DO NOTHING не возвращает строку, если профиль уже есть
+    return Profile.from_row(row or get_user_data(user_id))
+
+
+def _utc_now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+ADD_DAILY_TOTALS_SQL = '''
+    INSERT INTO daily_totals (user_id, day, water_ml, kcal_in, kcal_out)
+    VALUES (?, ?, COALESCE(?, 0), COALESCE(?, 0), COALESCE(?, 0))
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        water_ml = water_ml + excluded.water_ml,
+        kcal_in = kcal_in + excluded.kcal_in,
+        kcal_out = kcal_out + excluded.kcal_out
+'''
+
+# вид записи -> (таблица, колонки значений); у всех таблиц ещё user_id и timestamp
+LOG_COLUMNS = {
+    'water': ('water_logs', ('amount',)),
+    'food': ('food_logs', ('product_name', 'calories', 'grams')),
+    'workout': ('workout_logs', ('workout_type', 'duration_minutes', 'calories_burned')),
+}
+
+LOG_INSERT_SQL = {
+    kind: f'''INSERT INTO {table} (user_id, {', '.join(columns)}, timestamp)
+        VALUES ({', '.join('?' * (len(columns) + 2))})'''
+    for kind, (table, columns) in LOG_COLUMNS.items()
+}
+
+
+def log_entry(kind: str, user_id: int, *values):
+    # время фиксируется в момент действия пользователя, а не в момент записи в БД
+    return kind, (user_id, *values, _utc_now())
+
+
+def write_logs(entries):
+    # пачка записей логов и приращения daily_totals в одной транзакции;
+    # приращения сначала суммируются по (user_id, day)
+    rows = {}
+    totals = {}
+    for kind, params in entries:
+        rows.setdefault(kind, []).append(params)
+        user_id, ts = params[0], params[-1]
+        day_totals = totals.setdefault((user_id, ts[:10]), [0, 0, 0])
+        # NULL в значении (импорт старых логов) в итоги идёт как 0
+        if kind == 'water':
+            day_totals[0] += params[1] or 0
+        elif kind == 'food':
+            day_totals[1] += params[2] or 0
+        else:
+            day_totals[2] += params[3] or 0
+    conn = get_connection()
+    with conn:
+        for kind, params in rows.items():
+            conn.executemany(LOG_INSERT_SQL[kind], params)
+        conn.executemany(ADD_DAILY_TOTALS_SQL, [(*key, *day_totals) for key, day_totals in totals.items()])
+
+
+def iter_logs(user_id: Optional[int] = None, batch_size: int = 1000):
+    # выгрузка логов без загрузки всей таблицы в память: курсор читается
+    # порциями по batch_size строк; строки — (kind, user_id, timestamp, *values)
+    conn = get_connection()
+    for kind, (table, columns) in LOG_COLUMNS.items():
+        sql = f"SELECT user_id, timestamp, {', '.join(columns)} FROM {table}"
+        if user_id is None:
+            cur = conn.execute(sql)
+        else:
+            cur = conn.execute(sql + ' WHERE user_id=? ORDER BY timestamp', (user_id,))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield (kind, *row)
 
 
 def log_water(user_id: int, amount: float):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('INSERT INTO water_logs (user_id, amount) VALUES (?,?)', (user_id, amount))
-    conn.commit()
-    conn.close()
+    write_logs([log_entry('water', user_id, amount)])
 
 
 def log_food(user_id: int, product_name: str, calories: float, grams: float):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-        INSERT INTO food_logs (user_id, product_name, calories, grams) 
-        VALUES (?,?,?,?)
-    ''', (user_id, product_name, calories, grams))
-    conn.commit()
-    conn.close()
+    write_logs([log_entry('food', user_id, product_name, calories, grams)])
 
 
 def log_workout(user_id: int, wtype: str, duration: float, burned: float):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute('''
-        INSERT INTO workout_logs (user_id, workout_type, duration_minutes, calories_burned)
-        VALUES (?,?,?,?)
-    ''', (user_id, wtype, duration, burned))
-    conn.commit()
-    conn.close()
+    write_logs([log_entry('workout', user_id, wtype, duration, burned)])
+
+
+def _fill_days(by_day, first_day, days):
+    first = date.fromisoformat(first_day)
+    result = []
+    for i in range(days):
+        day = (first + timedelta(days=i)).isoformat()
+        result.append((day, *by_day.get(day, (0, 0, 0))))
+    return result
+
+
+def get_daily_totals(user_id: int, first_day: str, days: int):
+    # вода/съедено/сожжено по дням за [first_day, first_day + days) из таблицы
+    # daily_totals (поиск по первичному ключу); дни без записей заполняются нулями
+    start, end = day_range(first_day, days)
+    conn = get_connection()
+    rows = conn.execute('''
+        SELECT day, water_ml, kcal_in, kcal_out FROM daily_totals
+        WHERE user_id=? AND day >= ? AND day < ?
+    ''', (user_id, start, end)).fetchall()
+    return _fill_days({row[0]: row[1:] for row in rows}, first_day, days)
+
+
+def get_day_totals(user_id: int, day: str):
+    return get_daily_totals(user_id, day, 1)[0][1:]
+
+
+def rebuild_daily_totals():
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM daily_totals')
+        conn.execute(REBUILD_DAILY_TOTALS_SQL)
+        return conn.execute('SELECT COUNT(*) FROM daily_totals').fetchone()[0]
+
+
+def check_daily_totals(tolerance: float = 1e-6):
+    # расхождения между daily_totals и суммами по сырым логам:
+    # список (user_id, day, (вода, съедено, сожжено) в rollup, то же по логам)
+    conn = get_connection()
+    raw = {
+        (row[0], row[1]): tuple(v or 0 for v in row[2:])
+        for row in conn.execute(RAW_DAILY_SQL.format(where=''))
+    }
+    mismatches = []
+    for user_id, day, *totals in conn.execute(
+            'SELECT user_id, day, water_ml, kcal_in, kcal_out FROM daily_totals'):
+        expected = raw.pop((user_id, day), (0, 0, 0))
+        if any(abs(a - b) > tolerance for a, b in zip(totals, expected)):
+            mismatches.append((user_id, day, tuple(totals), expected))
+    for (user_id, day), expected in raw.items():
+        if any(abs(v) > tolerance for v in expected):
+            mismatches.append((user_id, day, (0, 0, 0), expected))
+    return mismatches
+
+
+def get_cached_products(name: str, owners):
+    # {user_id: (kcal_100g, source, fetched_at)} для записей кэша продукта у указанных владельцев
+    conn = get_connection()
+    placeholders = ','.join('?' * len(owners))
+    rows = conn.execute(
+        f'SELECT user_id, kcal_100g, source, fetched_at FROM product_cache '
+        f'WHERE name=? AND user_id IN ({placeholders})',
+        (name, *owners)
+    ).fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+
+def save_cached_product(owner: int, name: str, kcal_100g, source: str):
+    fetched_at = time.time()
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO product_cache (user_id, name, kcal_100g, source, fetched_at)
+            VALUES (?,?,?,?,?)
+        ''', (owner, name, kcal_100g, source, fetched_at))
+    return kcal_100g, source, fetched_at
+
+
+def get_translation(text: str):
+    conn = get_connection()
+    row = conn.execute('SELECT translated FROM translations WHERE text=?', (text,)).fetchone()
+    return row[0] if row else None
+
+
+def save_translation(text: str, translated: str):
+    conn = get_connection()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO translations (text, translated) VALUES (?,?)', (text, translated))
+
+
+def get_fsm_record(key: str):
+    conn = get_connection()
+    return conn.execute('SELECT state, data, updated_at FROM fsm_states WHERE key=?', (key,)).fetchone()
+
+
+def save_fsm_records(upserts, deletes):
+    # upserts: [(key, state, data, updated_at)], deletes: [key] — одной транзакцией
+    conn = get_connection()
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) VALUES (?,?,?,?)
+        ''', upserts)
+        conn.executemany('DELETE FROM fsm_states WHERE key=?', ((key,) for key in deletes))
+
+
+def purge_fsm_records(older_than: float):
+    conn = get_connection()
+    with conn:
+        return conn.execute('DELETE FROM fsm_states WHERE updated_at < ?', (older_than,)).rowcount
+
+
+def get_user_cities():
+    conn = get_connection()
+    return [row[0] for row in conn.execute('SELECT DISTINCT city FROM users')]
+
+
+# итоги считаются по логам, а не по daily_totals: та ведётся по датам UTC,
+# а сводка — за местный день; каждый подзапрос идёт по индексу (user_id, timestamp)
+SUMMARY_CANDIDATES_SQL = '''
+    SELECT u.user_id, u.weight, u.height, u.age, u.gender, u.activity_level, u.goal, u.city,
+           COALESCE((SELECT SUM(amount) FROM water_logs
+                     WHERE user_id = u.user_id AND timestamp >= :start AND timestamp < :end), 0),
+           COALESCE((SELECT SUM(calories) FROM food_logs
+                     WHERE user_id = u.user_id AND timestamp >= :start AND timestamp < :end), 0),
+           COALESCE((SELECT SUM(calories_burned) FROM workout_logs
+                     WHERE user_id = u.user_id AND timestamp >= :start AND timestamp < :end), 0)
+    FROM users u
+    LEFT JOIN summary_log s ON s.user_id = u.user_id
+    WHERE (s.day IS NULL OR s.day < :day) AND ({cities})
+    ORDER BY u.user_id
+'''
+
+
+def get_summary_candidates(cities, day: str, offset: int = 0, chunk: int = 500):
+    # пользователи из городов cities (None — без города), которым ещё не ушла
+    # сводка за местный день day (offset — смещение этих городов от UTC, с),
+    # вместе с итогами за этот день: 8 полей профиля и (вода, съедено, сожжено);
+    # один запрос на каждые chunk городов
+    conn = get_connection()
+    cities = list(cities)
+    start, end = day_range(day, offset=offset)
+    rows = []
+    for i in range(0, len(cities), chunk):
+        part = cities[i:i + chunk]
+        named = [c for c in part if c is not None]
+        params = {'day': day, 'start': start, 'end': end, **{f'c{n}': c for n, c in enumerate(named)}}
+        conds = []
+        if named:
+            conds.append(f"u.city IN ({','.join(f':c{n}' for n in range(len(named)))})")
+        if None in part:
+            conds.append('u.city IS NULL')
+        rows.extend(conn.execute(SUMMARY_CANDIDATES_SQL.format(cities=' OR '.join(conds)), params))
+    return rows
+
+
+def mark_summaries_sent(sent):
+    # sent: [(user_id, day)] — одной транзакцией
+    conn = get_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO summary_log (user_id, day) VALUES (?,?)
+            ON CONFLICT (user_id) DO UPDATE SET day = excluded.day
+        ''', sent)
@@ -0,0 +1,205 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+activity_factor = {
+    'min': 1.2,
+    'low': 1.375,
+    'med': 1.55,
+    'high': 1.725,
+    'vhigh': 1.9
+}
+
+# минут активности в день по уровню; каждые полные 30 минут — ещё 500 мл воды
+activity_minutes = {
+    'min': 0,
+    'low': 30,
+    'med': 60,
+    'high': 90,
+    'vhigh': 120
+}
+
+goal_factor = {
+    'loss': 0.85,
+    'maint': 1.0,
+    'gain': 1.15
+}
+
+gender_offset = {
+    'м': 5,
+    'ж': -161
+}
+
+# MET по виду тренировки
+workout_types = {
+    'hodba': 4.0,
+    'beg': 9.0,
+    'velo': 8.0,
+    'ellip': 6.0,
+    'erg': 8.0,
+    'step': 7.0,
+    'hiit': 10.0,
+    'hike': 5.0,
+    'yoga': 4.0,
+    'func': 7.0,
+    'dance': 6.0,
+    'recovery': 3.0,
+    'core': 6.0,
+    'pilates': 4.5,
+    'taichi': 4.0,
+    'swim': 8.0,
+    'kick': 10.0
+}
+
+intensity_cal_factor = {
+    'слабая': 0.8,
+    'средняя': 1.0,
+    'высокая': 1.2
+}
+
+intensity_water_bonus = {
+    'слабая': 0.25,
+    'средняя': 0.40,
+    'высокая': 0.50
+}
+
+HOT_TEMP = 25
+
+
+def _codes(table):
+    return {key: code for code, key in enumerate(table)}
+
+
+# Категориальные поля профиля в массивах хранятся кодами: код — индекс ключа
+# в словаре выше, последний код (len(словаря)) — неизвестное значение.
+# Таблицы коэффициентов индексируются этими кодами, так что поиск по словарю
+# для массива профилей превращается в одно взятие по индексу.
+GENDER_CODES = _codes(gender_offset)
+ACTIVITY_CODES = _codes(activity_factor)
+GOAL_CODES = _codes(goal_factor)
+INTENSITY_CODES = _codes(intensity_cal_factor)
+
+_GENDER_OFFSET = np.array([*gender_offset.values(), 0], dtype=np.float64)
+_ACTIVITY_MULT = np.array([*activity_factor.values(), activity_factor['min']])
+_ACTIVITY_WATER = np.array(
+    [m // 30 * 500 for m in activity_minutes.values()] + [activity_minutes['low'] // 30 * 500],
+    dtype=np.float64
+)
+_GOAL_MULT = np.array([*goal_factor.values(), 1.0])
+_INTENSITY_CAL = np.array([*intensity_cal_factor.values(), 1.0])
+_INTENSITY_WATER = np.array([*intensity_water_bonus.values(), 0.0])
+
+
+def encode(values, codes):
+    unknown = len(codes)
+    return np.fromiter((codes.get(v, unknown) for v in values), dtype=np.int8)
+
+
+@dataclass
+class ProfileArrays:
+    user_id: np.ndarray
+    weight: np.ndarray
+    height: np.ndarray
+    age: np.ndarray
+    gender: np.ndarray
+    activity: np.ndarray
+    goal: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows):
+        # строки таблицы users или db.Profile: (user_id, weight, height, age, gender, activity, goal, ...)
+        rows = list(rows)
+        return cls(
+            user_id=np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+            weight=np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows)),
+            height=np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows)),
+            age=np.fromiter((r[3] for r in rows), dtype=np.float64, count=len(rows)),
+            gender=encode((r[4] for r in rows), GENDER_CODES),
+            activity=encode((r[5] for r in rows), ACTIVITY_CODES),
+            goal=encode((r[6] for r in rows), GOAL_CODES),
+        )
+
+    def __len__(self):
+        return len(self.user_id)
+
+
+@dataclass
+class Targets:
+    bmr: np.ndarray
+    calories: np.ndarray
+    burn_goal: np.ndarray
+    water: np.ndarray
+
+
+def bmr(weight, height, age, gender):
+    # Mifflin-St Jeor; gender — код из GENDER_CODES
+    return 10 * weight + 6.25 * height - 5 * age + _GENDER_OFFSET[gender]
+
+
+def daily_calories(bmr_val, activity, goal):
+    return bmr_val * _ACTIVITY_MULT[activity] * _GOAL_MULT[goal]
+
+
+def burn_goal(calories, bmr_val, goal, base=1.0):
+    return calories - bmr_val * base * _GOAL_MULT[goal]
+
+
+def daily_water(weight, activity, temp=None):
+    # temp — °C, NaN или None, если температура неизвестна
+    water = weight * 30 + _ACTIVITY_WATER[activity]
+    if temp is None:
+        return water
+    return water + np.where(np.greater(temp, HOT_TEMP), 500, 0)
+
+
+def targets(profiles: ProfileArrays, temp=None):
+    bmr_val = bmr(profiles.weight, profiles.height, profiles.age, profiles.gender)
+    calories = daily_calories(bmr_val, profiles.activity, profiles.goal)
+    return Targets(
+        bmr=bmr_val,
+        calories=calories,
+        burn_goal=burn_goal(calories, bmr_val, profiles.goal),
+        water=daily_water(profiles.weight, profiles.activity, temp),
+    )
+
+
+def workout_burned(met, weight, minutes, intensity):
+    return met * weight * (minutes / 60.0) * _INTENSITY_CAL[intensity]
+
+
+def workout_water_loss(burned, intensity, temp=None):
+    loss = burned * (1 + _INTENSITY_WATER[intensity])
+    if temp is None:
+        return loss
+    return loss * np.where(np.greater(temp, HOT_TEMP), 1.15, 1.0)
+
+
+# Скалярные обёртки для обработчиков: те же формулы для одного профиля.
+
+def raw_bmr(weight, height, age, gender):
+    return float(bmr(weight, height, age, GENDER_CODES.get(gender, len(GENDER_CODES))))
+
+
+def calculate_daily_calories(weight, height, age, gender, activity, goal):
+    return float(daily_calories(
+        raw_bmr(weight, height, age, gender),
+        ACTIVITY_CODES.get(activity, len(ACTIVITY_CODES)),
+        GOAL_CODES.get(goal, len(GOAL_CODES))
+    ))
+
+
+def calculate_burn_goal(weight, height, age, gender, activity, goal, base=1.0):
+    bmr_val = raw_bmr(weight, height, age, gender)
+    calories = calculate_daily_calories(weight, height, age, gender, activity, goal)
+    return float(burn_goal(calories, bmr_val, GOAL_CODES.get(goal, len(GOAL_CODES)), base))
+
+
+def calculate_daily_water(weight, activity_level, temp):
+    return float(daily_water(weight, ACTIVITY_CODES.get(activity_level, len(ACTIVITY_CODES)), temp))
+
+
+def calculate_workout(alias, weight, minutes, intensity, temp):
+    # (сожжённые ккал, потеря жидкости в мл) для одной тренировки
+    code = INTENSITY_CODES[intensity]
+    burned = float(workout_burned(workout_types[alias], weight, minutes, code))
+    return burned, float(workout_water_loss(burned, code, temp))
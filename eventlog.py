@@ -0,0 +1,155 @@
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+import metrics
+from config import LOGGING_LEVEL, LOGGING_FORMAT, LOGGING_FILE, LOGGING_SAMPLING, LOGGING_RATE_LIMIT
+
+TEXT_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+
+_listener = None
+_sampler = None
+_queue = None
+stats = {'sampled_out': 0, 'rate_limited': 0}
+
+
+def parse_sampling(spec):
+    # 'INFO:0.1,DEBUG:0' -> {logging.INFO: 0.1, logging.DEBUG: 0.0}
+    rates = {}
+    for part in spec.split(','):
+        if part.strip():
+            name, _, rate = part.partition(':')
+            rates[logging.getLevelName(name.strip().upper())] = float(rate)
+    return rates
+
+
+class Sampler(logging.Filter):
+    # Записи ниже WARNING пропускаются с вероятностью sampling[уровень] и не больше
+    # rate_limit в секунду на уровень (0 — без ограничения); WARNING и выше
+    # пишутся всегда. Запись, для которой решение уже принято через allow()
+    # (extra={'sampled': True}), проходит без повторной проверки.
+    def __init__(self, sampling, rate_limit):
+        super().__init__()
+        self.sampling = sampling
+        self.rate_limit = rate_limit
+        self._windows = {}
+
+    def allow(self, level):
+        if level >= logging.WARNING:
+            return True
+        rate = self.sampling.get(level, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            stats['sampled_out'] += 1
+            return False
+        if self.rate_limit:
+            now = time.monotonic()
+            window = self._windows.get(level)
+            if window is None or now - window[0] >= 1.0:
+                window = self._windows[level] = [now, 0]
+            if window[1] >= self.rate_limit:
+                stats['rate_limited'] += 1
+                return False
+            window[1] += 1
+        return True
+
+    def filter(self, record):
+        return getattr(record, 'sampled', False) or self.allow(record.levelno)
+
+
+class JsonFormatter(logging.Formatter):
+    # одна запись — одна компактная JSON-строка; поля событий (extra={'fields': {...}}
+    # или emit()) попадают на верхний уровень вместо текста сообщения
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            # у структурных событий сообщение лишь повторяет поля
+            entry.update(fields)
+        else:
+            entry['msg'] = record.getMessage()
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    # стандартный QueueHandler форматирует сообщение ещё в вызывающем потоке;
+    # здесь запись уходит в очередь как есть и форматируется потоком слушателя
+    def prepare(self, record):
+        return record
+
+
+class EventListener(QueueListener):
+    # кроме LogRecord принимает события (время, логгер, уровень, сообщение, поля)
+    # из emit(): LogRecord для них собирается уже в фоновом потоке
+    def prepare(self, item):
+        if not isinstance(item, tuple):
+            return item
+        created, name, level, msg, fields = item
+        record = logging.LogRecord(name, level, '', 0, msg, (fields,), None)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        record.fields = fields
+        return record
+
+
+def sample(level):
+    # принять решение о записи до того, как собирать её поля
+    return _sampler is None or _sampler.allow(level)
+
+
+def emit(logger, level, msg, fields):
+    # Структурное событие, уже прошедшее sample(): в очередь кладётся кортеж,
+    # без LogRecord и поиска вызывающего кадра; msg форматируется полями
+    # (%(name)s) в фоновом потоке. Без setup() — обычная запись через logging.
+    if _queue is None:
+        logger.log(level, msg, fields, extra={'fields': fields})
+    else:
+        _queue.put_nowait((time.time(), logger.name, level, msg, fields))
+
+
+def setup(level=LOGGING_LEVEL, fmt=LOGGING_FORMAT, path=LOGGING_FILE,
+          sampling=LOGGING_SAMPLING, rate_limit=LOGGING_RATE_LIMIT):
+    # корневой логгер пишет в очередь, а форматирование и вывод (stderr или файл)
+    # выполняются в фоновом потоке QueueListener
+    global _listener, _sampler, _queue
+    shutdown()
+    sink = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler(sys.stderr)
+    sink.setFormatter(JsonFormatter() if fmt == 'jsonl' else logging.Formatter(TEXT_FORMAT))
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    _queue = records
+    _sampler = Sampler(parse_sampling(sampling), rate_limit)
+    handler.addFilter(_sampler)
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    _listener = EventListener(records, sink)
+    _listener.start()
+
+
+def shutdown():
+    # дописывает всё, что осталось в очереди
+    global _listener, _queue
+    _queue = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+@metrics.register_collector
+def log_metrics():
+    return [(
+        'log_records_dropped_total', 'counter', 'Log records dropped by sampling or rate limit',
+        [({'reason': 'sampling'}, stats['sampled_out']), ({'reason': 'rate_limit'}, stats['rate_limited'])],
+    )]
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DEFAULT_DESTINY
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import async_db
+from config import FSM_STORAGE, FSM_FLUSH_INTERVAL, FSM_TTL
+
+PURGE_EVERY = 600
+
+
+def encode_key(key):
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.destiny != DEFAULT_DESTINY:
+        parts.append(key.destiny)
+    return ':'.join(parts)
+
+
+def encode_data(data):
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_data(raw):
+    return json.loads(raw) if raw else {}
+
+
+class SQLiteStorage(BaseStorage):
+    # Состояние читается из памяти процесса, а изменения копятся в _dirty и раз в
+    # flush_interval пишутся в таблицу fsm_states одной транзакцией: несколько
+    # set_state/update_data одного шага диалога превращаются в одну запись.
+    # Диалоги без активности дольше ttl считаются брошенными и удаляются;
+    # пустые и устаревшие записи периодически выгружаются из памяти.
+    def __init__(self, flush_interval=FSM_FLUSH_INTERVAL, ttl=FSM_TTL):
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._records = {}
+        self._dirty = set()
+        self._flush_task = None
+        self._last_purge = time.time()
+
+    async def _load(self, key):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        skey = encode_key(key)
+        record = self._records.get(skey)
+        if record is None:
+            row = await async_db.get_fsm_record(skey)
+            if row is None:
+                record = [None, {}, time.time()]
+            else:
+                record = [row[0], decode_data(row[1]), row[2]]
+            # пока шёл запрос, запись могла появиться из параллельного вызова
+            record = self._records.setdefault(skey, record)
+        if time.time() - record[2] > self.ttl:
+            record[0], record[1] = None, {}
+            self._dirty.add(skey)
+        return skey, record
+
+    def _touch(self, skey, record):
+        record[2] = time.time()
+        self._dirty.add(skey)
+
+    async def set_state(self, bot, key, state=None):
+        skey, record = await self._load(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._touch(skey, record)
+
+    async def get_state(self, bot, key):
+        _, record = await self._load(key)
+        return record[0]
+
+    async def set_data(self, bot, key, data):
+        skey, record = await self._load(key)
+        record[1] = data.copy()
+        self._touch(skey, record)
+
+    async def get_data(self, bot, key):
+        _, record = await self._load(key)
+        return record[1].copy()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        upserts = []
+        deletes = []
+        for skey in dirty:
+            state, data, updated_at = self._records[skey]
+            if state is None and not data:
+                deletes.append(skey)
+            else:
+                upserts.append((skey, state, encode_data(data), updated_at))
+        try:
+            await async_db.save_fsm_records(upserts, deletes)
+        except BaseException:
+            self._dirty |= dirty
+            raise
+
+    async def purge_expired(self):
+        now = time.time()
+        for skey, (state, data, updated_at) in list(self._records.items()):
+            if skey in self._dirty:
+                continue
+            if (state is None and not data) or now - updated_at > self.ttl:
+                del self._records[skey]
+        return await async_db.purge_fsm_records(now - self.ttl)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - self._last_purge > PURGE_EVERY:
+                    self._last_purge = time.time()
+                    await self.purge_expired()
+            except Exception:
+                logging.exception('FSM storage flush failed')
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+
+def create_storage():
+    if FSM_STORAGE == 'memory':
+        return MemoryStorage()
+    return SQLiteStorage()
@@ -1,36 +1,48 @@
 import math
+import os
 import re
-import sqlite3
+from dataclasses import astuple
 from datetime import datetime, timedelta
-from io import BytesIO
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 from aiogram import Router, F, Bot
 from aiogram.types import (
     Message,
     CallbackQuery,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
-    BufferedInputFile
+    BufferedInputFile,
+    FSInputFile
 )
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from googletrans import Translator
 
-from db import (
-    get_user_data,
+from async_db import (
     create_or_update_user,
     log_water,
     log_food,
-    log_workout
+    log_workout,
+    get_day_totals,
+    get_daily_totals,
+    export_user_logs
 )
 from weather_api import get_temperature, get_local_time_for_city
-from nutrition_api import get_product_calories
-from config import DB_NAME
+from nutrition_api import get_product_calories, save_user_calories
+from translator import translate_ru_en
+from energy import (
+    calculate_daily_calories,
+    calculate_daily_water,
+    calculate_burn_goal,
+    calculate_workout
+)
+from logs_io import FORMATS as EXPORT_FORMATS
+from charts import render_daily_totals, ChartQueueFull, chart_cache
+from config import NUTRITION_SAVE_MANUAL, CHART_REUSE_FILE_ID
+from db import Profile
 
 router = Router()
 
+CHART_DAYS = 7
+
 
 class ProfileStates(StatesGroup):
     waiting_for_weight = State()
@@ -58,20 +70,6 @@ class WorkoutStates(StatesGroup):
     waiting_for_duration = State()
 
 
-activity_factor = {
-    'min': 1.2,
-    'low': 1.375,
-    'med': 1.55,
-    'high': 1.725,
-    'vhigh': 1.9
-}
-
-goal_factor = {
-    'loss': 0.85,
-    'maint': 1.0,
-    'gain': 1.15
-}
-
 workout_alias = {
     'hodba': 'Ходьба',
     'beg': 'Бег',
@@ -92,38 +90,6 @@ workout_alias = {
     'kick': 'Кикбоксинг'
 }
 
-workout_types = {
-    'hodba': 4.0,
-    'beg': 9.0,
-    'velo': 8.0,
-    'ellip': 6.0,
-    'erg': 8.0,
-    'step': 7.0,
-    'hiit': 10.0,
-    'hike': 5.0,
-    'yoga': 4.0,
-    'func': 7.0,
-    'dance': 6.0,
-    'recovery': 3.0,
-    'core': 6.0,
-    'pilates': 4.5,
-    'taichi': 4.0,
-    'swim': 8.0,
-    'kick': 10.0
-}
-
-intensity_cal_factor = {
-    'слабая': 0.8,
-    'средняя': 1.0,
-    'высокая': 1.2
-}
-
-intensity_water_bonus = {
-    'слабая': 0.25,
-    'средняя': 0.40,
-    'высокая': 0.50
-}
-
 
 def main_menu_keyboard():
     kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -143,37 +109,6 @@ def main_menu_keyboard():
     return kb
 
 
-def raw_bmr(weight, height, age, gender):
-    if gender == 'м':
-        return 10 * weight + 6.25 * height - 5 * age + 5
-    elif gender == 'ж':
-        return 10 * weight + 6.25 * height - 5 * age - 161
-    else:
-        return 10 * weight + 6.25 * height - 5 * age
-
-
-def calculate_daily_calories(weight, height, age, gender, activity, goal):
-    bmr_val = raw_bmr(weight, height, age, gender)
-    act_mult = activity_factor.get(activity, 1.2)
-    goal_mult = goal_factor.get(goal, 1.0)
-    return bmr_val * act_mult * goal_mult
-
-
-def calculate_daily_water(weight, activity_level, temp):
-    base = weight * 30
-    lvl_map = {
-        'min': 0,
-        'low': 30,
-        'med': 60,
-        'high': 90,
-        'vhigh': 120
-    }
-    mins = lvl_map.get(activity_level, 30)
-    extra_act = (mins // 30) * 500
-    extra_weather = 500 if temp and temp > 25 else 0
-    return base + extra_act + extra_weather
-
-
 @router.message(Command('help'))
 async def cmd_help(message: Message, bot: Bot):
     text = (
@@ -185,6 +120,7 @@ async def cmd_help(message: Message, bot: Bot):
         '/check_progress — прогресс\n'
         '/show_charts — графики за 7 дней\n'
         '/recommend — рекомендации\n'
+        '/export — выгрузка всех записей (csv или jsonl)\n'
         '/help — это сообщение'
     )
     await message.answer(text)
@@ -206,9 +142,8 @@ async def set_profile_flow(bot: Bot, user_id: int, state: FSMContext):
 
 
 @router.message(Command('start'))
-async def cmd_start(message: Message, state: FSMContext, bot: Bot):
-    user = get_user_data(message.from_user.id)
-    if not user:
+async def cmd_start(message: Message, state: FSMContext, bot: Bot, profile: Profile):
+    if not profile:
         await message.answer('Профиль не найден, давайте создадим!')
         await set_profile_flow(bot, message.from_user.id, state)
     else:
@@ -332,7 +267,7 @@ async def callback_goal(callback: CallbackQuery, state: FSMContext, bot: Bot):
 async def process_city(message: Message, state: FSMContext, bot: Bot):
     c = message.text.strip()
     data = await state.get_data()
-    create_or_update_user(
+    await create_or_update_user(
         user_id=message.from_user.id,
         weight=data['weight'],
         height=data['height'],
@@ -347,66 +282,78 @@ async def process_city(message: Message, state: FSMContext, bot: Bot):
 
 
 @router.message(Command('log_water'))
-async def cmd_log_water(message: Message, bot: Bot, state: FSMContext):
-    user = get_user_data(message.from_user.id)
-    if not user:
+async def cmd_log_water(message: Message, bot: Bot, state: FSMContext, profile: Profile):
+    if not profile:
         await message.answer('Нет профиля. Сначала /set_profile')
         return
     await log_water_command(bot, message.from_user.id, state)
 
 
 @router.message(Command('log_food'))
-async def cmd_log_food(message: Message, bot: Bot, state: FSMContext):
-    user = get_user_data(message.from_user.id)
-    if not user:
+async def cmd_log_food(message: Message, bot: Bot, state: FSMContext, profile: Profile):
+    if not profile:
         await message.answer('Нет профиля. Сначала /set_profile')
         return
     await log_food_command(bot, message.from_user.id, state)
 
 
 @router.message(Command('log_workout'))
-async def cmd_log_workout(message: Message, bot: Bot, state: FSMContext):
-    user = get_user_data(message.from_user.id)
-    if not user:
+async def cmd_log_workout(message: Message, bot: Bot, state: FSMContext, profile: Profile):
+    if not profile:
         await message.answer('Нет профиля. Сначала /set_profile')
         return
     await log_workout_command(bot, message.from_user.id, state)
 
 
 @router.message(Command('check_progress'))
-async def cmd_check_progress(message: Message, bot: Bot):
-    user = get_user_data(message.from_user.id)
-    if not user:
+async def cmd_check_progress(message: Message, bot: Bot, profile: Profile):
+    if not profile:
         await message.answer('Нет профиля. Сначала /set_profile')
         return
-    await show_progress(bot, message.from_user.id)
+    await show_progress(bot, profile)
 
 
 @router.message(Command('show_charts'))
-async def cmd_show_charts(message: Message, bot: Bot):
-    user = get_user_data(message.from_user.id)
-    if not user:
+async def cmd_show_charts(message: Message, bot: Bot, profile: Profile):
+    if not profile:
         await message.answer('Нет профиля. Сначала /set_profile')
         return
-    await show_charts(bot, message.from_user.id)
+    await show_charts(bot, profile)
 
 
 @router.message(Command('recommend'))
-async def cmd_recommend(message: Message, bot: Bot):
-    user = get_user_data(message.from_user.id)
-    if not user:
+async def cmd_recommend(message: Message, bot: Bot, profile: Profile):
+    if not profile:
         await message.answer('Нет профиля. Сначала /set_profile')
         return
     await cmd_recommend_menu(bot, message.from_user.id)
 
 
+@router.message(Command('export'))
+async def cmd_export(message: Message, bot: Bot, command: CommandObject):
+    fmt = (command.args or 'csv').strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        await message.answer('Формат выгрузки: /export csv или /export jsonl')
+        return
+    path, count = await export_user_logs(message.from_user.id, fmt)
+    try:
+        if not count:
+            await message.answer('Пока нет ни одной записи.')
+            return
+        await message.answer_document(
+            FSInputFile(path, filename=f'fitness_logs.{fmt}'),
+            caption=f'Записей: {count}'
+        )
+    finally:
+        os.remove(path)
+
+
 @router.callback_query(F.data.startswith('CMD:'))
-async def callback_main_commands(callback: CallbackQuery, bot: Bot, state: FSMContext):
+async def callback_main_commands(callback: CallbackQuery, bot: Bot, state: FSMContext, profile: Profile):
     cmd = callback.data.split('CMD:')[1]
     await callback.answer()
     uid = callback.from_user.id
-    user = get_user_data(uid)
-    if cmd in ['/log_water', '/log_food', '/log_workout', '/check_progress', '/show_charts', '/recommend'] and not user:
+    if cmd in ['/log_water', '/log_food', '/log_workout', '/check_progress', '/show_charts', '/recommend'] and not profile:
         await callback.message.answer('Нет профиля. Сначала /set_profile')
         return
     if cmd == '/log_water':
@@ -416,9 +363,9 @@ async def callback_main_commands(callback: CallbackQuery, bot: Bot, state: FSMCo
     elif cmd == '/log_workout':
         await log_workout_command(bot, uid, state)
     elif cmd == '/check_progress':
-        await show_progress(bot, uid)
+        await show_progress(bot, profile)
     elif cmd == '/show_charts':
-        await show_charts(bot, uid)
+        await show_charts(bot, profile)
     elif cmd == '/recommend':
         await cmd_recommend_menu(bot, uid)
     else:
@@ -437,7 +384,8 @@ async def process_water_amount(message: Message, bot: Bot, state: FSMContext):
     except ValueError:
         await message.answer('Введите число (мл).')
         return
-    log_water(message.from_user.id, amt)
+    await log_water(message.from_user.id, amt)
+    chart_cache.invalidate(message.from_user.id)
     await message.answer(f'Записано {amt} мл воды.', reply_markup=main_menu_keyboard())
     await state.clear()
 
@@ -464,18 +412,18 @@ async def process_food_weight(message: Message, bot: Bot, state: FSMContext):
     data = await state.get_data()
     pname = data['food_name']
     if re.search(r'[а-яА-Я]', pname):
-        translator = Translator()
-        en = translator.translate(pname, src='ru', dest='en').text
+        en = await translate_ru_en(pname)
     else:
         en = pname
-    kcal_100g = get_product_calories(en)
+    kcal_100g = await get_product_calories(en, user_id=message.from_user.id)
     if kcal_100g is None:
-        await state.update_data(grams=grams)
+        await state.update_data(grams=grams, query_name=en)
         await message.answer(f'Не нашли "{pname}" ("{en}"). Введите ккал/100г вручную:')
         await state.set_state(FoodLogStates.waiting_for_manual_calorie)
         return
     total_kcal = (kcal_100g / 100.0) * grams
-    log_food(message.from_user.id, pname, total_kcal, grams)
+    await log_food(message.from_user.id, pname, total_kcal, grams)
+    chart_cache.invalidate(message.from_user.id)
     await message.answer(f'Записано: {pname} — {total_kcal:.1f} ккал.', reply_markup=main_menu_keyboard())
     await state.clear()
 
@@ -490,8 +438,11 @@ async def process_food_manual_cal(message: Message, bot: Bot, state: FSMContext)
     data = await state.get_data()
     pname = data['food_name']
     grams = data['grams']
+    if NUTRITION_SAVE_MANUAL:
+        await save_user_calories(message.from_user.id, data.get('query_name', pname), cals_100g)
     total_kcal = (cals_100g / 100.0) * grams
-    log_food(message.from_user.id, pname, total_kcal, grams)
+    await log_food(message.from_user.id, pname, total_kcal, grams)
+    chart_cache.invalidate(message.from_user.id)
     await message.answer(f'Записано вручную: {pname} — {total_kcal:.1f} ккал.', reply_markup=main_menu_keyboard())
     await state.clear()
 
@@ -533,7 +484,7 @@ async def callback_workout_intensity(callback: CallbackQuery, bot: Bot, state: F
 
 
 @router.message(WorkoutStates.waiting_for_duration)
-async def process_workout_duration(message: Message, bot: Bot, state: FSMContext):
+async def process_workout_duration(message: Message, bot: Bot, state: FSMContext, profile: Profile):
     try:
         dur = float(message.text)
     except ValueError:
@@ -542,22 +493,17 @@ async def process_workout_duration(message: Message, bot: Bot, state: FSMContext
     data = await state.get_data()
     alias = data['workout_alias']
     intens = data['intensity']
-    user = get_user_data(message.from_user.id)
-    if not user:
+    if not profile:
         await message.answer('Нет профиля. Сначала /set_profile')
         await state.clear()
         return
-    weight = user[1]
-    city = user[7] if len(user) >= 8 else None
-    met = workout_types[alias]
+    weight = profile.weight
+    city = profile.city
     w_name = workout_alias[alias]
-    base_burned = met * weight * (dur / 60.0)
-    burned = base_burned * intensity_cal_factor[intens]
-    log_workout(message.from_user.id, w_name, dur, burned)
-    temp = get_temperature(city) if city else None
-    water_loss = burned * (1 + intensity_water_bonus[intens])
-    if temp and temp > 25:
-        water_loss *= 1.15
+    temp = await get_temperature(city) if city else None
+    burned, water_loss = calculate_workout(alias, weight, dur, intens, temp)
+    await log_workout(message.from_user.id, w_name, dur, burned)
+    chart_cache.invalidate(message.from_user.id)
     rec = ''
     if dur > 60:
         rec = '\nИспользуйте напитки с электролитами.'
@@ -573,35 +519,8 @@ async def process_workout_duration(message: Message, bot: Bot, state: FSMContext
     await state.clear()
 
 
-async def show_progress(bot: Bot, user_id: int):
-    user = get_user_data(user_id)
-    if not user:
-        await bot.send_message(user_id, 'Нет профиля. /set_profile')
-        return
-    u_id = user[0]
-    weight = user[1]
-    height = user[2]
-    age = user[3]
-    gender = user[4]
-    act_level = user[5]
-    goal = user[6]
-    city = user[7] if len(user) >= 8 else None
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    cur.execute('SELECT SUM(amount) FROM water_logs WHERE user_id=? AND date(timestamp)=?', (u_id, today_str))
-    water_sum = cur.fetchone()[0] or 0
-    cur.execute('SELECT SUM(calories) FROM food_logs WHERE user_id=? AND date(timestamp)=?', (u_id, today_str))
-    food_sum = cur.fetchone()[0] or 0
-    cur.execute('SELECT SUM(calories_burned) FROM workout_logs WHERE user_id=? AND date(timestamp)=?', (u_id, today_str))
-    burned_sum = cur.fetchone()[0] or 0
-    conn.close()
-    temp = get_temperature(city) if city else None
-    bmr_val = raw_bmr(weight, height, age, gender)
-    daily_c = calculate_daily_calories(weight, height, age, gender, act_level, goal)
-    goal_mult = goal_factor.get(goal, 1.0)
-    burn_goal = daily_c - (bmr_val * goal_mult)
-    water_need = calculate_daily_water(weight, act_level, temp)
+def progress_text(title, totals, daily_c, burn_goal, water_need):
+    water_sum, food_sum, burned_sum = totals
     w_left = water_need - water_sum
     if w_left < 0:
         w_left = 0
@@ -611,8 +530,8 @@ async def show_progress(bot: Bot, user_id: int):
     burn_left = burn_goal - burned_sum
     if burn_left < 0:
         burn_left = 0
-    text = (
-        f'Прогресс за сегодня {today_str}:\n\n'
+    return (
+        f'{title}:\n\n'
         f'<b>Вода</b>:\n'
         f' - Выпито: {water_sum:.0f} мл / {water_need:.0f} мл\n'
         f' - Осталось: {w_left:.0f} мл\n\n'
@@ -624,70 +543,55 @@ async def show_progress(bot: Bot, user_id: int):
         f' - Осталось потребить: {consume_left:.0f} ккал\n'
         f' - Осталось сжечь: {burn_left:.0f} ккал\n'
     )
-    await bot.send_message(user_id, text, reply_markup=main_menu_keyboard())
 
 
-async def show_charts(bot: Bot, user_id: int):
-    user = get_user_data(user_id)
-    if not user:
-        await bot.send_message(user_id, 'Нет профиля. /set_profile')
-        return
-    city = user[7] if len(user) >= 8 else None
-    local_now = get_local_time_for_city(city) if city else datetime.now()
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    days_dt = []
-    water_data = []
-    eaten_data = []
-    burned_data = []
-    for i in range(7):
-        local_day = local_now - timedelta(days=i)
-        day_str = local_day.strftime('%Y-%m-%d')
-        days_dt.append(local_day)
-        cursor.execute('SELECT SUM(amount) FROM water_logs WHERE user_id=? AND date(timestamp)=?', (user_id, day_str))
-        wsum = cursor.fetchone()[0] or 0
-        water_data.append(wsum)
-        cursor.execute('SELECT SUM(calories) FROM food_logs WHERE user_id=? AND date(timestamp)=?', (user_id, day_str))
-        esum = cursor.fetchone()[0] or 0
-        eaten_data.append(esum)
-        cursor.execute('SELECT SUM(calories_burned) FROM workout_logs WHERE user_id=? AND date(timestamp)=?', (user_id, day_str))
-        bsum = cursor.fetchone()[0] or 0
-        burned_data.append(bsum)
-    conn.close()
-    days_dt.reverse()
-    water_data.reverse()
-    eaten_data.reverse()
-    burned_data.reverse()
-    fig, ax = plt.subplots(nrows=3, ncols=1, figsize=(6, 10))
-    ax[0].plot(days_dt, water_data, marker='o', color='blue')
-    ax[0].set_title('Вода (мл) за 7 дней')
-    ax[0].grid(True)
-    ax[0].tick_params(axis='x', rotation=45)
-    ax[0].xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-    ax[1].plot(days_dt, eaten_data, marker='o', color='red')
-    ax[1].set_title('Потреблённые ккал за 7 дней')
-    ax[1].grid(True)
-    ax[1].tick_params(axis='x', rotation=45)
-    ax[1].xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-    ax[2].plot(days_dt, burned_data, marker='o', color='green')
-    ax[2].set_title('Сожжённые ккал за 7 дней')
-    ax[2].grid(True)
-    ax[2].tick_params(axis='x', rotation=45)
-    ax[2].xaxis.set_major_formatter(mdates.DateFormatter('%m-%d'))
-    plt.tight_layout()
-    bio = BytesIO()
-    plt.savefig(bio, format='png')
-    bio.seek(0)
-    plt.close(fig)
-    chart_file = BufferedInputFile(bio.getvalue(), filename='progress.png')
-    await bot.send_photo(user_id, chart_file, caption='Прогресс за 7 дней', reply_markup=main_menu_keyboard())
+async def show_progress(bot: Bot, profile: Profile):
+    u_id = profile.user_id
+    weight = profile.weight
+    height = profile.height
+    age = profile.age
+    gender = profile.gender
+    act_level = profile.activity_level
+    goal = profile.goal
+    city = profile.city
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    totals = await get_day_totals(u_id, today_str)
+    temp = await get_temperature(city) if city else None
+    daily_c = calculate_daily_calories(weight, height, age, gender, act_level, goal)
+    burn_goal = calculate_burn_goal(weight, height, age, gender, act_level, goal)
+    water_need = calculate_daily_water(weight, act_level, temp)
+    text = progress_text(f'Прогресс за сегодня {today_str}', totals, daily_c, burn_goal, water_need)
+    await bot.send_message(u_id, text, reply_markup=main_menu_keyboard())
+
+
+async def show_charts(bot: Bot, profile: Profile):
+    user_id = profile.user_id
+    city = profile.city
+    local_now = await get_local_time_for_city(city) if city else datetime.now()
+    today = local_now.strftime('%Y-%m-%d')
+    cached = chart_cache.get(user_id, CHART_DAYS, today)
+    if cached:
+        photo = cached.file_id or BufferedInputFile(cached.png, filename='progress.png')
+    else:
+        generation = chart_cache.generation(user_id)
+        first_day = (local_now - timedelta(days=CHART_DAYS - 1)).strftime('%Y-%m-%d')
+        rows = await get_daily_totals(user_id, first_day, CHART_DAYS)
+        try:
+            png = await render_daily_totals(rows)
+        except ChartQueueFull:
+            await bot.send_message(user_id, 'Сейчас строится много графиков, попробуйте через минуту.')
+            return
+        chart_cache.put(user_id, CHART_DAYS, today, png, generation)
+        photo = BufferedInputFile(png, filename='progress.png')
+    sent = await bot.send_photo(
+        user_id, photo, caption=f'Прогресс за {CHART_DAYS} дней', reply_markup=main_menu_keyboard()
+    )
+    if CHART_REUSE_FILE_ID and sent.photo:
+        # повторно отправляем по file_id, не загружая файл в Telegram заново
+        chart_cache.set_file_id(user_id, CHART_DAYS, today, sent.photo[-1].file_id)
 
 
 async def cmd_recommend_menu(bot: Bot, user_id: int):
-    user = get_user_data(user_id)
-    if not user:
-        await bot.send_message(user_id, 'Нет профиля. /set_profile')
-        return
     kb = InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text='Еда', callback_data='RC:foods'),
         InlineKeyboardButton(text='Тренировки', callback_data='RC:workouts')
@@ -696,29 +600,20 @@ async def cmd_recommend_menu(bot: Bot, user_id: int):
 
 
 @router.callback_query(F.data.startswith('RC:'))
-async def callback_recommend(callback: CallbackQuery, bot: Bot):
+async def callback_recommend(callback: CallbackQuery, bot: Bot, profile: Profile):
     choice = callback.data.split('RC:')[1]
-    user = get_user_data(callback.from_user.id)
-    if not user:
+    if not profile:
         await callback.message.answer('Нет профиля. Сначала /set_profile')
         await callback.answer()
         return
-    (u_id, weight, height, age, gender, act_level, goal, city) = user[:8]
+    (u_id, weight, height, age, gender, act_level, goal, city) = astuple(profile)
     daily_c = calculate_daily_calories(weight, height, age, gender, act_level, goal)
-    bmr_val = raw_bmr(weight, height, age, gender)
-    goal_mult = goal_factor.get(goal, 1.0)
-    burn_goal = daily_c - (bmr_val * 1.2 * goal_mult)
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
+    burn_goal = calculate_burn_goal(weight, height, age, gender, act_level, goal, base=1.2)
     today_str = datetime.now().strftime('%Y-%m-%d')
-    cur.execute('SELECT SUM(calories) FROM food_logs WHERE user_id=? AND date(timestamp)=?', (u_id, today_str))
-    food_sum = cur.fetchone()[0] or 0
-    cur.execute('SELECT SUM(calories_burned) FROM workout_logs WHERE user_id=? AND date(timestamp)=?', (u_id, today_str))
-    burned_sum = cur.fetchone()[0] or 0
-    conn.close()
-    local_now = get_local_time_for_city(city) if city else datetime.now()
+    _, food_sum, burned_sum = await get_day_totals(u_id, today_str)
+    local_now = await get_local_time_for_city(city) if city else datetime.now()
     hour = local_now.hour
-    temp = get_temperature(city) if city else None
+    temp = await get_temperature(city) if city else None
     is_hot = (temp and temp > 25)
     partial_c = (daily_c / 18.0) * hour
     food_diff = partial_c - food_sum
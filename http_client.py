@@ -0,0 +1,74 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+
+from config import (
+    HTTP_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_BACKOFF,
+    HTTP_CONN_LIMIT,
+    HTTP_CONN_PER_HOST
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+
+
+def get_session():
+    # одна сессия на процесс: keep-alive соединения переиспользуются между запросами
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONN_LIMIT,
+            limit_per_host=HTTP_CONN_PER_HOST,
+            ttl_dns_cache=300
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+    return _session
+
+
+async def get_json(url, params=None):
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        data = await _get_json(url, params)
+        outcome = 'ok'
+        return data
+    finally:
+        metrics.api_latency.observe(time.perf_counter() - start, urlsplit(url).hostname, outcome)
+
+
+async def _get_json(url, params=None):
+    if params:
+        # как и requests, не передаём параметры со значением None
+        params = {k: v for k, v in params.items() if v is not None}
+    delay = HTTP_BACKOFF
+    for attempt in range(HTTP_RETRIES + 1):
+        last_attempt = attempt == HTTP_RETRIES
+        try:
+            async with get_session().get(url, params=params) as resp:
+                if resp.status in RETRY_STATUSES and not last_attempt:
+                    raise aiohttp.ClientResponseError(
+                        resp.request_info, resp.history, status=resp.status
+                    )
+                return await resp.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if last_attempt:
+                raise
+        await asyncio.sleep(delay)
+        delay *= 2
+
+
+async def close():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
@@ -0,0 +1,153 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from itertools import islice
+
+import db
+from config import EXPORT_FETCH_SIZE, IMPORT_BATCH_SIZE
+
+FORMATS = ('csv', 'jsonl')
+
+# общий заголовок CSV: у каждого вида записи заполнены только свои колонки
+FIELDS = (
+    'kind', 'user_id', 'timestamp',
+    'amount', 'product_name', 'calories', 'grams',
+    'workout_type', 'duration_minutes', 'calories_burned'
+)
+NUMERIC = {'amount', 'calories', 'grams', 'duration_minutes', 'calories_burned'}
+_POSITIONS = {kind: [FIELDS.index(c) for c in columns] for kind, (_, columns) in db.LOG_COLUMNS.items()}
+
+
+def guess_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+
+def write_csv(rows, f):
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    count = 0
+    for kind, user_id, ts, *values in rows:
+        line = [kind, user_id, ts] + [''] * (len(FIELDS) - 3)
+        for pos, value in zip(_POSITIONS[kind], values):
+            line[pos] = value
+        writer.writerow(line)
+        count += 1
+    return count
+
+
+def write_jsonl(rows, f):
+    count = 0
+    for kind, user_id, ts, *values in rows:
+        record = {'kind': kind, 'user_id': user_id, 'timestamp': ts}
+        record.update(zip(db.LOG_COLUMNS[kind][1], values))
+        f.write(json.dumps(record, ensure_ascii=False))
+        f.write('\n')
+        count += 1
+    return count
+
+
+def _normalize_ts(ts):
+    # в БД время хранится как 'YYYY-MM-DD HH:MM:SS' (UTC), от этого зависят
+    # диапазонные запросы по индексу и день в daily_totals
+    if len(ts) == 19 and ts[10] == ' ':
+        return ts
+    dt = datetime.fromisoformat(ts)
+    if dt.tzinfo is not None:
+        # время со смещением ('...+03:00') переводится в UTC, а не обрезается
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _number(value):
+    # NULL выгружается в CSV пустой строкой, в JSONL — null; обратно это NULL
+    return None if value is None or value == '' else float(value)
+
+
+def _entry(record):
+    kind = record['kind']
+    if kind not in db.LOG_COLUMNS:
+        raise ValueError(f'unknown log kind: {kind!r}')
+    values = [_number(record[c]) if c in NUMERIC else record[c] for c in db.LOG_COLUMNS[kind][1]]
+    return kind, (int(record['user_id']), *values, _normalize_ts(record['timestamp']))
+
+
+def read_csv(f):
+    for record in csv.DictReader(f):
+        yield _entry(record)
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield _entry(json.loads(line))
+
+
+# профили: user_id и любые колонки из db.USER_COLUMNS; пустые значения не
+# меняют то, что уже записано в профиле
+PROFILE_TYPES = {'weight': float, 'height': float, 'age': int}
+
+
+def _profile(record):
+    profile = {'user_id': int(record['user_id'])}
+    for column in db.USER_COLUMNS:
+        value = record.get(column)
+        if value is not None and value != '':
+            profile[column] = PROFILE_TYPES.get(column, str)(value)
+    return profile
+
+
+def read_profiles_csv(f):
+    for record in csv.DictReader(f):
+        yield _profile(record)
+
+
+def read_profiles_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield _profile(json.loads(line))
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+PROFILE_READERS = {'csv': read_profiles_csv, 'jsonl': read_profiles_jsonl}
+
+
+def export_logs(f, fmt, user_id=None):
+    return WRITERS[fmt](db.iter_logs(user_id, EXPORT_FETCH_SIZE), f)
+
+
+def import_logs(f, fmt, batch_size=IMPORT_BATCH_SIZE):
+    # каждая пачка — одна транзакция: executemany по таблицам и daily_totals
+    entries = READERS[fmt](f)
+    total = 0
+    while True:
+        batch = list(islice(entries, batch_size))
+        if not batch:
+            return total
+        db.write_logs(batch)
+        total += len(batch)
+
+
+def import_profiles(f, fmt, batch_size=IMPORT_BATCH_SIZE):
+    # пачка профилей — одна транзакция db.create_or_update_users (UPSERT через executemany)
+    profiles = PROFILE_READERS[fmt](f)
+    total = 0
+    while True:
+        batch = list(islice(profiles, batch_size))
+        if not batch:
+            return total
+        total += db.create_or_update_users(batch)
+
+
+def export_user_file(user_id, fmt):
+    # файл для отправки пользователю; удалить его должен вызывающий
+    fd, path = tempfile.mkstemp(prefix=f'logs_{user_id}_', suffix=f'.{fmt}')
+    try:
+        with open(fd, 'w', encoding='utf-8', newline='') as f:
+            count = export_logs(f, fmt, user_id)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
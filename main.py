@@ -1,37 +1,77 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher, BaseMiddleware
-from aiogram.types import Message, CallbackQuery
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram import Bot
 
-import db
-from config import BOT_TOKEN
+import async_db
+import charts
+import eventlog
+import http_client
+import metrics
+import translator
+import webhook
+from config import BOT_TOKEN, BOT_MODE, SUMMARY_ENABLED, METRICS_ENABLED, PREWARM, SHARD_WORKERS
+from fsm_storage import create_storage
 from handlers import router
+from middlewares import EventLogMiddleware, ProfileMiddleware, MetricsMiddleware
+from ordering import OrderedDispatcher
+from sharding import ShardRouter
+from summaries import SummaryScheduler
 
-logging.basicConfig(level=logging.INFO)
 
+async def prewarm():
+    try:
+        await asyncio.gather(charts.prewarm(), translator.prewarm())
+    except Exception:
+        logging.exception('Prewarm failed')
 
-class LoggerMiddleware(BaseMiddleware):
-    async def __call__(self, handler, event, data):
-        if isinstance(event, Message):
-            text = event.text or ''
-            user_id = event.from_user.id if event.from_user else 'unknown'
-            logging.info(f'[Message] User {user_id} sent: {text}')
-        elif isinstance(event, CallbackQuery):
-            user_id = event.from_user.id if event.from_user else 'unknown'
-            data_cb = event.data
-            logging.info(f'[Callback] User {user_id} pressed: {data_cb}')
-        return await handler(event, data)
+
+def create_dispatcher():
+    dp = OrderedDispatcher(storage=create_storage())
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    dp.message.middleware(EventLogMiddleware())
+    dp.callback_query.middleware(EventLogMiddleware())
+    dp.message.middleware(ProfileMiddleware())
+    dp.callback_query.middleware(ProfileMiddleware())
+    dp.include_router(router)
+    return dp
 
 
 async def main():
-    db.init_db()
+    eventlog.setup()
+    await async_db.init_db()
     bot = Bot(token=BOT_TOKEN, parse_mode='HTML')
-    dp = Dispatcher(storage=MemoryStorage())
-    dp.message.middleware(LoggerMiddleware())
-    dp.callback_query.middleware(LoggerMiddleware())
-    dp.include_router(router)
-    await dp.start_polling(bot)
+    # с SHARD_WORKERS апдейты обрабатывают процессы-воркеры, а этот процесс
+    # только раздаёт их и рассылает вечерние сводки
+    dp = ShardRouter(SHARD_WORKERS, create_dispatcher) if SHARD_WORKERS else create_dispatcher()
+    scheduler = SummaryScheduler(bot) if SUMMARY_ENABLED else None
+    metrics_runner = await metrics.start_server() if METRICS_ENABLED else None
+    prewarm_task = asyncio.create_task(prewarm()) if PREWARM and not SHARD_WORKERS else None
+    try:
+        if SHARD_WORKERS:
+            dp.start()
+        if scheduler is not None:
+            scheduler.start()
+        if BOT_MODE == 'webhook':
+            await webhook.run(dp, bot, background=not SHARD_WORKERS)
+        elif SHARD_WORKERS:
+            await dp.poll(bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if SHARD_WORKERS:
+            await dp.stop()
+        if prewarm_task is not None:
+            prewarm_task.cancel()
+        if scheduler is not None:
+            await scheduler.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await async_db.flush_logs()
+        await http_client.close()
+        charts.shutdown()
+        async_db.shutdown()
+        eventlog.shutdown()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,86 @@
+import argparse
+import sys
+import time
+
+import db
+import logs_io
+
+
+def cmd_rebuild_totals(args):
+    rows = db.rebuild_daily_totals()
+    print(f'daily_totals rebuilt: {rows} rows')
+
+
+def cmd_check_totals(args):
+    mismatches = db.check_daily_totals()
+    for user_id, day, rollup, raw in mismatches[:args.limit]:
+        print(f'user {user_id} {day}: rollup={rollup} raw={raw}')
+    if mismatches:
+        print(f'{len(mismatches)} mismatching days, run "python manage.py rebuild-totals"')
+        return 1
+    print('daily_totals is consistent with the logs')
+    return 0
+
+
+def _open(path, mode):
+    if path == '-':
+        return open((sys.stdin if 'r' in mode else sys.stdout).fileno(), mode, encoding='utf-8', newline='', closefd=False)
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def cmd_export_logs(args):
+    fmt = args.format or logs_io.guess_format(args.path)
+    start = time.perf_counter()
+    with _open(args.path, 'w') as f:
+        count = logs_io.export_logs(f, fmt, args.user)
+    print(f'exported {count} rows in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+
+def cmd_import_logs(args):
+    fmt = args.format or logs_io.guess_format(args.path)
+    start = time.perf_counter()
+    with _open(args.path, 'r') as f:
+        count = logs_io.import_logs(f, fmt, args.batch)
+    print(f'imported {count} rows in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+
+def cmd_import_users(args):
+    fmt = args.format or logs_io.guess_format(args.path)
+    start = time.perf_counter()
+    with _open(args.path, 'r') as f:
+        count = logs_io.import_profiles(f, fmt, args.batch)
+    print(f'imported {count} profiles in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintenance commands for the bot database')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('rebuild-totals', help='recompute daily_totals from the raw logs').set_defaults(func=cmd_rebuild_totals)
+    check = sub.add_parser('check-totals', help='compare daily_totals with sums over the raw logs')
+    check.add_argument('--limit', type=int, default=20, help='how many mismatches to print')
+    check.set_defaults(func=cmd_check_totals)
+    export = sub.add_parser('export-logs', help='write water/food/workout logs to a CSV or JSONL file')
+    export.add_argument('path', help='output file, "-" for stdout')
+    export.add_argument('--format', choices=logs_io.FORMATS, help='default: by file extension, csv otherwise')
+    export.add_argument('--user', type=int, help='export only this user')
+    export.set_defaults(func=cmd_export_logs)
+    load = sub.add_parser('import-logs', help='append logs from a CSV or JSONL file (daily_totals are updated)')
+    load.add_argument('path', help='input file, "-" for stdin')
+    load.add_argument('--format', choices=logs_io.FORMATS, help='default: by file extension, csv otherwise')
+    load.add_argument('--batch', type=int, default=logs_io.IMPORT_BATCH_SIZE, help='rows per transaction')
+    load.set_defaults(func=cmd_import_logs)
+    users = sub.add_parser('import-users', help='create or update user profiles from a CSV or JSONL file')
+    users.add_argument('path', help='input file with user_id and profile columns, "-" for stdin')
+    users.add_argument('--format', choices=logs_io.FORMATS, help='default: by file extension, csv otherwise')
+    users.add_argument('--batch', type=int, default=logs_io.IMPORT_BATCH_SIZE, help='profiles per transaction')
+    users.set_defaults(func=cmd_import_users)
+    args = parser.parse_args()
+    db.init_db()
+    try:
+        return args.func(args) or 0
+    finally:
+        db.close_connections()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import logging
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT
+
+# границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in self._values.items():
+            yield f'{self.name}{_format_labels(self.labels, labels)} {value}'
+
+
+class Histogram:
+    # значения по label-кортежам: [число в каждой корзине (последняя — +Inf), сумма, количество];
+    # observe вызывается только из event loop, поэтому без блокировок
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def count(self, *labels):
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def render(self):
+        yield f'# HELP {self.name} {self.doc}'
+        yield f'# TYPE {self.name} histogram'
+        names = self.labels + ('le',)
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ('+Inf',), counts):
+                cumulative += n
+                yield f'{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, labels)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labels, labels)} {count}'
+
+
+def register_collector(fn):
+    # fn() -> [(имя, тип, описание, [(словарь меток, значение)])], вызывается при каждом /metrics
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception:
+            logging.exception('metrics collector %s failed', fn.__name__)
+            continue
+        for name, kind, doc, samples in families:
+            lines.append(f'# HELP {name} {doc}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class timer:
+    # with timer(histogram, *labels): ... — наблюдает длительность блока
+    def __init__(self, histogram, *labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+updates = Counter('bot_updates_total', 'Handled updates by type and route', ('type', 'route'))
+handler_latency = Histogram(
+    'bot_handler_duration_seconds', 'Time spent in middlewares and the handler', ('handler', 'route')
+)
+handler_errors = Counter('bot_handler_errors_total', 'Handlers that raised', ('handler',))
+db_latency = Histogram(
+    'db_query_duration_seconds', 'Database calls from the event loop, including queueing', ('op', 'kind')
+)
+api_latency = Histogram(
+    'external_api_duration_seconds', 'External API requests, including retries', ('host', 'outcome')
+)
+
+
+@register_collector
+def cache_metrics():
+    # модули с кэшами импортируются при первом запросе /metrics, а не при импорте metrics
+    import async_db
+    import charts
+    import nutrition_api
+    import translator
+    import weather_api
+    weather = weather_api.cache_stats()
+    translations = translator.cache_stats()
+    nutrition = nutrition_api.cache_stats()
+    caches = {
+        'profiles': async_db._profiles.stats(),
+        'weather_temperature': weather['temperature'],
+        'weather_timezone': weather['timezone'],
+        'nutrition': nutrition['lru'],
+        'translation': {
+            'hits': translations['fallback'] + translations['memory'] + translations['db'],
+            'misses': translations['remote'],
+        },
+        'charts': charts.chart_cache.stats(),
+    }
+    ratio = [
+        ({'cache': name}, s['hits'] / (s['hits'] + s['misses']) if s['hits'] + s['misses'] else 0.0)
+        for name, s in caches.items()
+    ]
+    return [
+        ('cache_hits_total', 'counter', 'Cache hits', [({'cache': n}, s['hits']) for n, s in caches.items()]),
+        ('cache_misses_total', 'counter', 'Cache misses', [({'cache': n}, s['misses']) for n, s in caches.items()]),
+        ('cache_hit_ratio', 'gauge', 'Cache hit ratio since start', ratio),
+        ('external_api_coalesced_total', 'counter', 'Lookups that joined an in-flight upstream request', [
+            ({'api': 'weather'}, weather['coalesced']),
+            ({'api': 'nutrition'}, nutrition['coalesced']),
+        ]),
+    ]
+
+
+async def handle_metrics(request):
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+
+def make_app():
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+
+async def start_server(host=METRICS_HOST, port=METRICS_PORT):
+    runner = web.AppRunner(make_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info('Metrics on http://%s:%s/metrics', host, port)
+    return runner
@@ -0,0 +1,84 @@
+import logging
+import time
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+
+import eventlog
+import metrics
+from async_db import get_profile
+
+update_log = logging.getLogger('updates')
+UPDATE_MESSAGE = 'update %(update_id)s user %(user_id)s %(route)s -> %(handler)s %(ms)s ms %(status)s'
+
+
+class ProfileMiddleware(BaseMiddleware):
+    # профиль загружается один раз на апдейт (из кэша async_db) и передаётся
+    # обработчику аргументом profile: Profile | None
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        data['profile'] = await get_profile(user.id) if user else None
+        return await handler(event, data)
+
+
+def update_route(event):
+    # метка маршрута с ограниченным числом значений: команда для сообщений,
+    # префикс callback_data ('WT:', 'RC:'...) для кнопок, у 'CMD:' — вся команда меню
+    if isinstance(event, Message):
+        text = event.text or ''
+        if text.startswith('/'):
+            return text.split(maxsplit=1)[0].split('@')[0]
+        return 'text' if text else 'other'
+    if isinstance(event, CallbackQuery):
+        data = event.data or ''
+        if data.startswith('CMD:'):
+            return data
+        prefix, sep, _ = data.partition(':')
+        return prefix + sep if sep else 'other'
+    return 'other'
+
+
+def handler_name(data):
+    return data['handler'].callback.__name__ if 'handler' in data else 'unknown'
+
+
+class MetricsMiddleware(BaseMiddleware):
+    # счётчик апдейтов по маршруту и гистограмма задержки по обработчику;
+    # регистрируется первой, чтобы время включало и остальные middleware
+    async def __call__(self, handler, event, data):
+        route = update_route(event)
+        name = handler_name(data)
+        metrics.updates.inc('message' if isinstance(event, Message) else 'callback_query', route)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.handler_errors.inc(name)
+            raise
+        finally:
+            metrics.handler_latency.observe(time.perf_counter() - start, name, route)
+
+
+class EventLogMiddleware(BaseMiddleware):
+    # Одна структурная запись на апдейт после обработчика: update_id, пользователь,
+    # маршрут, обработчик, длительность и исход. Решение о сэмплировании
+    # принимается до сборки полей, текст сообщения не пишется, а запись
+    # собирается, форматируется и выводится в потоке eventlog.
+    async def __call__(self, handler, event, data):
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = await handler(event, data)
+            status = 'ok'
+            return result
+        finally:
+            if update_log.isEnabledFor(logging.INFO) and eventlog.sample(logging.INFO):
+                update = data.get('event_update')
+                user = data.get('event_from_user')
+                eventlog.emit(update_log, logging.INFO, UPDATE_MESSAGE, {
+                    'update_id': update.update_id if update else None,
+                    'user_id': user.id if user else None,
+                    'route': update_route(event),
+                    'handler': handler_name(data),
+                    'ms': round((time.perf_counter() - start) * 1000, 2),
+                    'status': status,
+                })
@@ -1,24 +1,99 @@
-import requests
-from config import USDA_API_KEY
+import time
 
+import async_db
+from cache import TTLCache, SingleFlight, MISSING
+from config import (
+    USDA_API_KEY,
+    USDA_API_URL,
+    NUTRITION_TTL,
+    NUTRITION_NEGATIVE_TTL,
+    NUTRITION_CACHE_SIZE,
+    NUTRITION_LRU_TTL
+)
+from http_client import get_json
 
-def get_product_calories(product_name):
-    url = 'https://api.nal.usda.gov/fdc/v1/foods/search'
+GLOBAL = 0
+
+# (владелец, нормализованное имя) -> (kcal_100g, source, fetched_at) или None, если записи нет
+_lru = TTLCache(NUTRITION_CACHE_SIZE, NUTRITION_LRU_TTL)
+# одновременные промахи по одному продукту ждут один запрос к USDA и одну запись в кэш
+_flights = SingleFlight()
+_upstream_calls = 0
+
+
+def normalize_name(name):
+    return ' '.join(name.lower().split())
+
+
+async def _fetch_calories(product_name):
+    global _upstream_calls
+    url = f'{USDA_API_URL}/foods/search'
     params = {
         'api_key': USDA_API_KEY,
         'query': product_name,
         'pageSize': 1
     }
-    try:
-        response = requests.get(url, params=params)
-        data = response.json()
-        foods = data.get('foods')
-        if not foods:
-            return None
-        first_food = foods[0]
-        nutrients = first_food.get('foodNutrients', [])
-        for n in nutrients:
-            if n.get('nutrientId') == 1008:
-                return float(n.get('value'))
-    except:
+    _upstream_calls += 1
+    data = await get_json(url, params)
+    foods = data.get('foods')
+    if not foods:
         return None
+    first_food = foods[0]
+    nutrients = first_food.get('foodNutrients', [])
+    for n in nutrients:
+        if n.get('nutrientId') == 1008:
+            return float(n.get('value'))
+    return None
+
+
+async def _lookup(name, owners):
+    entries = {owner: _lru.get((owner, name), MISSING) for owner in owners}
+    missing = [owner for owner, entry in entries.items() if entry is MISSING]
+    if missing:
+        rows = await async_db.get_cached_products(name, missing)
+        for owner in missing:
+            entries[owner] = rows.get(owner)
+            _lru.set((owner, name), entries[owner])
+    return entries
+
+
+def _is_fresh(entry):
+    kcal_100g, _, fetched_at = entry
+    ttl = NUTRITION_TTL if kcal_100g is not None else NUTRITION_NEGATIVE_TTL
+    return time.time() - fetched_at < ttl
+
+
+async def _store(owner, name, kcal_100g, source):
+    entry = await async_db.save_cached_product(owner, name, kcal_100g, source)
+    _lru.set((owner, name), entry)
+
+
+async def _refresh(name, product_name):
+    kcal_100g = await _fetch_calories(product_name)
+    await _store(GLOBAL, name, kcal_100g, 'usda')
+    return kcal_100g
+
+
+async def get_product_calories(product_name, user_id=None):
+    name = normalize_name(product_name)
+    owners = (GLOBAL,) if user_id is None else (user_id, GLOBAL)
+    entries = await _lookup(name, owners)
+    override = entries.get(user_id)
+    if override is not None:
+        return override[0]
+    cached = entries[GLOBAL]
+    if cached is not None and _is_fresh(cached):
+        return cached[0]
+    try:
+        return await _flights.do(name, _refresh, name, product_name)
+    except Exception:
+        # USDA недоступен: лучше устаревшее значение, чем ничего
+        return cached[0] if cached is not None else None
+
+
+async def save_user_calories(user_id, product_name, kcal_100g):
+    await _store(user_id, normalize_name(product_name), kcal_100g, 'manual')
+
+
+def cache_stats():
+    return {'lru': _lru.stats(), 'upstream_calls': _upstream_calls, 'coalesced': _flights.shared}
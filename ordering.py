@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from functools import partial
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+
+import metrics
+from config import UPDATE_MAX_CONCURRENCY, CALLBACK_STALE_AFTER, CHAT_QUEUE_LIMIT
+
+stats = {'waiting': 0, 'running': 0}
+
+queue_wait = metrics.Histogram(
+    'bot_update_queue_seconds', 'Time an update waited for its chat turn and a free slot', ('type',)
+)
+shed = metrics.Counter('bot_updates_shed_total', 'Updates dropped before handling', ('type', 'reason'))
+
+
+def update_chat_id(update):
+    # ключ очереди: чат сообщения, для кнопки — чат сообщения с кнопкой;
+    # None — апдейт без чата, он ни с чем не упорядочивается
+    if update.message is not None:
+        return update.message.chat.id
+    query = update.callback_query
+    if query is not None:
+        return query.message.chat.id if query.message is not None else query.from_user.id
+    return None
+
+
+class ChatScheduler:
+    # Апдейты одного чата обрабатываются строго в порядке поступления (WT: →
+    # INT: → длительность не обгоняют друг друга и видят состояние FSM после
+    # предыдущего шага), разных чатов — параллельно, но не больше max_concurrency
+    # одновременно. Место занимается, только когда подошла очередь чата, так
+    # что ожидающие апдейты одного чата не мешают остальным. Нажатие кнопки,
+    # прождавшее дольше callback_ttl секунд, отбрасывается: Telegram уже снял
+    # индикатор загрузки и ответить на такой запрос нельзя. Если в очереди чата
+    # уже max_queued апдейтов, новый отбрасывается сразу: снаружи (воркер
+    # sharding) каждый ожидающий апдейт занимает место, и один чат не должен
+    # занять их все.
+    def __init__(self, max_concurrency=UPDATE_MAX_CONCURRENCY, callback_ttl=CALLBACK_STALE_AFTER,
+                 max_queued=CHAT_QUEUE_LIMIT):
+        self.callback_ttl = callback_ttl
+        self.max_queued = max_queued
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tails = {}
+        self._queued = {}
+
+    async def run(self, update, process):
+        # process() вызывается, когда подошла очередь; регистрация в очереди
+        # чата идёт до первого await, поэтому порядок задаётся порядком вызовов
+        kind = 'callback_query' if update.callback_query is not None else 'message'
+        chat_id = update_chat_id(update)
+        if chat_id is not None and self.max_queued and self._queued.get(chat_id, 0) >= self.max_queued:
+            shed.inc(kind, 'chat_queue_full')
+            logging.info('Dropped %s from chat %s: %d updates already queued', kind, chat_id, self.max_queued)
+            return UNHANDLED
+        prev = self._tails.get(chat_id) if chat_id is not None else None
+        done = asyncio.get_running_loop().create_future()
+        if chat_id is not None:
+            self._tails[chat_id] = done
+            self._queued[chat_id] = self._queued.get(chat_id, 0) + 1
+        start = time.monotonic()
+        stats['waiting'] += 1
+        waiting = True
+        try:
+            if prev is not None:
+                # shield: отмена этого апдейта не должна отменять ожидание предыдущего
+                await asyncio.shield(prev)
+            async with self._slots:
+                waited = time.monotonic() - start
+                stats['waiting'] -= 1
+                waiting = False
+                self._dequeue(chat_id)
+                queue_wait.observe(waited, kind)
+                if kind == 'callback_query' and self.callback_ttl and waited > self.callback_ttl:
+                    shed.inc(kind, 'stale')
+                    logging.info('Dropped callback query from chat %s after %.1f s in queue', chat_id, waited)
+                    return UNHANDLED
+                stats['running'] += 1
+                try:
+                    return await process()
+                finally:
+                    stats['running'] -= 1
+        finally:
+            if waiting:
+                stats['waiting'] -= 1
+                self._dequeue(chat_id)
+            if prev is not None and not prev.done():
+                # отменён, не дождавшись очереди: следующий ждёт предыдущего
+                prev.add_done_callback(partial(self._release, chat_id, done))
+            else:
+                self._release(chat_id, done)
+
+    def _dequeue(self, chat_id):
+        if chat_id is None:
+            return
+        left = self._queued[chat_id] - 1
+        if left:
+            self._queued[chat_id] = left
+        else:
+            del self._queued[chat_id]
+
+    def _release(self, chat_id, done, _=None):
+        done.set_result(None)
+        if self._tails.get(chat_id) is done:
+            del self._tails[chat_id]
+
+
+class OrderedDispatcher(Dispatcher):
+    # Dispatcher, у которого каждый апдейт (polling, webhook, воркер sharding)
+    # проходит через ChatScheduler до всех middleware: FSMContextMiddleware
+    # читает состояние уже в очереди чата
+    def __init__(self, *args, scheduler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or ChatScheduler()
+
+    async def feed_update(self, bot, update, **kwargs):
+        return await self.scheduler.run(update, partial(super().feed_update, bot, update, **kwargs))
+
+
+@metrics.register_collector
+def scheduler_metrics():
+    return [
+        ('bot_updates_waiting', 'gauge', 'Updates waiting for their chat turn or a free slot',
+         [({}, stats['waiting'])]),
+        ('bot_updates_running', 'gauge', 'Updates being handled', [({}, stats['running'])]),
+    ]
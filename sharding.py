@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+from functools import partial
+
+from aiogram import Bot
+
+import async_db
+import charts
+import eventlog
+import http_client
+import metrics
+import translator
+from config import (
+    BOT_TOKEN,
+    METRICS_ENABLED,
+    METRICS_PORT,
+    PREWARM,
+    SHARD_QUEUE_SIZE,
+    SHARD_MAX_CONCURRENCY,
+    SHARD_SHUTDOWN_TIMEOUT
+)
+
+# типы апдейтов, на которые есть обработчики; супервизор запрашивает у Telegram
+# только их, потому что своего диспетчера у него нет
+ALLOWED_UPDATES = ['message', 'callback_query']
+
+
+def update_user_id(update):
+    # id пользователя из сырого апдейта (dict в формате Bot API): поле 'from'
+    # события, иначе чат; 0 — апдейт без пользователя
+    for value in update.values():
+        if isinstance(value, dict):
+            sender = value.get('from') or value.get('chat')
+            if sender is not None:
+                return sender['id']
+    return 0
+
+
+def shard_for(user_id, shards):
+    return user_id % shards
+
+
+def default_bot():
+    return Bot(token=BOT_TOKEN, parse_mode='HTML')
+
+
+def worker_main(index, updates, processed, dispatcher_factory, bot_factory):
+    # точка входа процесса-воркера; Ctrl+C получает вся группа процессов,
+    # а останавливает воркер супервизор — маркером None в очереди
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker(index, updates, processed, dispatcher_factory, bot_factory))
+
+
+async def _worker(index, updates, processed, dispatcher_factory, bot_factory):
+    eventlog.setup()
+    # миграции уже выполнил супервизор, здесь это проверка версии схемы
+    await async_db.init_db()
+    bot = bot_factory()
+    dp = dispatcher_factory()
+    loop = asyncio.get_running_loop()
+    metrics_runner = await metrics.start_server(port=METRICS_PORT + 1 + index) if METRICS_ENABLED else None
+
+    # порядок апдейтов одного пользователя соблюдает сам диспетчер (OrderedDispatcher),
+    # здесь только ограничение числа апдейтов в работе; место занимают и апдейты,
+    # ждущие очереди своего чата, но их у одного чата не больше CHAT_QUEUE_LIMIT
+    slots = asyncio.Semaphore(SHARD_MAX_CONCURRENCY)
+    tasks = set()
+
+    async def process(update):
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception:
+            logging.exception('Failed to process update %s', update.get('update_id'))
+        finally:
+            processed.value += 1
+            slots.release()
+
+    async def submit(update):
+        await slots.acquire()
+        task = asyncio.create_task(process(update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def read():
+        # блокирующее чтение multiprocessing.Queue — в отдельном потоке;
+        # следующий апдейт читается, только когда предыдущий принят в работу,
+        # так что задачи создаются в порядке очереди
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            asyncio.run_coroutine_threadsafe(submit(update), loop).result()
+
+    prewarm = None
+    try:
+        await dp.emit_startup(bot=bot)
+        if PREWARM:
+            prewarm = asyncio.ensure_future(
+                asyncio.gather(charts.prewarm(), translator.prewarm(), return_exceptions=True)
+            )
+        await loop.run_in_executor(None, read)
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=SHARD_SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+    finally:
+        if prewarm is not None:
+            prewarm.cancel()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await async_db.flush_logs()
+        await http_client.close()
+        charts.shutdown()
+        async_db.shutdown()
+        eventlog.shutdown()
+
+
+class ShardRouter:
+    # Супервизор: каждый апдейт уходит в один из N процессов-воркеров по
+    # user_id % N. Все апдейты пользователя обрабатывает один и тот же процесс
+    # (по порядку — см. ordering.py), поэтому его FSM, кэш профиля и графиков живут в одном месте,
+    # а общая БД (WAL, busy_timeout) видит из каждого процесса только своих
+    # пользователей. Повторяет методы Dispatcher, которыми пользуется
+    # WebhookServer, так что webhook.run() работает с роутером вместо dp.
+    def __init__(self, workers, dispatcher_factory, bot_factory=default_bot, queue_size=SHARD_QUEUE_SIZE):
+        ctx = multiprocessing.get_context('spawn')
+        self.queues = [ctx.Queue(queue_size) for _ in range(workers)]
+        # lock не нужен: счётчик увеличивает только свой воркер
+        self.processed = [ctx.Value('q', 0, lock=False) for _ in range(workers)]
+        self.routed = [0] * workers
+        self.dropped = [0] * workers
+        self._reported = set()
+        self.processes = [
+            ctx.Process(
+                target=worker_main,
+                args=(i, self.queues[i], self.processed[i], dispatcher_factory, bot_factory),
+                name=f'shard-{i}',
+                daemon=True
+            )
+            for i in range(workers)
+        ]
+        metrics.register_collector(self.collect_metrics)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        logging.info('Started %d shard workers', len(self.processes))
+
+    def _dead(self, shard):
+        # воркер упал: его апдейты отбрасываются, а не копятся в очереди,
+        # которую никто не читает (иначе роутер встанет, когда она заполнится)
+        process = self.processes[shard]
+        if process.is_alive():
+            return False
+        if shard not in self._reported:
+            self._reported.add(shard)
+            logging.error('Shard worker %s exited with code %s, dropping its updates',
+                          process.name, process.exitcode)
+        return True
+
+    async def feed_raw_update(self, bot, update):
+        shard = shard_for(update_user_id(update), len(self.queues))
+        updates = self.queues[shard]
+        loop = asyncio.get_running_loop()
+        while not self._dead(shard):
+            try:
+                updates.put_nowait(update)
+            except queue.Full:
+                # очередь воркера заполнена: ждём, и Telegram (webhook) или
+                # getUpdates (polling) притормаживает вместе с нами; ждём порциями,
+                # чтобы заметить, если воркер за это время упал
+                try:
+                    await loop.run_in_executor(None, partial(updates.put, update, timeout=1))
+                except queue.Full:
+                    continue
+            self.routed[shard] += 1
+            return
+        self.dropped[shard] += 1
+
+    async def emit_startup(self, **kwargs):
+        pass
+
+    async def emit_shutdown(self, **kwargs):
+        pass
+
+    async def poll(self, bot, timeout=30):
+        # long polling в супервизоре; апдейты передаются воркерам как dict Bot API
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        offset = None
+        stopping = asyncio.create_task(stop.wait())
+        try:
+            while not stop.is_set():
+                request = asyncio.create_task(
+                    bot.get_updates(offset=offset, timeout=timeout, allowed_updates=ALLOWED_UPDATES)
+                )
+                await asyncio.wait([request, stopping], return_when=asyncio.FIRST_COMPLETED)
+                if not request.done():
+                    request.cancel()
+                    break
+                try:
+                    updates = request.result()
+                except Exception:
+                    logging.exception('Failed to fetch updates')
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    await self.feed_raw_update(bot, update.dict(by_alias=True, exclude_none=True))
+                    offset = update.update_id + 1
+        finally:
+            stopping.cancel()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            await bot.session.close()
+
+    async def stop(self, timeout=SHARD_SHUTDOWN_TIMEOUT):
+        # маркер None в каждую очередь: воркер дорабатывает принятые апдейты
+        # и завершается; кто не успел за timeout, останавливается принудительно
+        loop = asyncio.get_running_loop()
+        for shard, updates in enumerate(self.queues):
+            if not self._dead(shard):
+                await loop.run_in_executor(None, updates.put, None)
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logging.warning('Shard worker %s did not stop in time', process.name)
+                process.terminate()
+
+    def collect_metrics(self):
+        shards = range(len(self.queues))
+        return [
+            ('shard_updates_routed_total', 'counter', 'Updates routed to a shard worker',
+             [({'shard': i}, self.routed[i]) for i in shards]),
+            ('shard_updates_processed_total', 'counter', 'Updates processed by a shard worker',
+             [({'shard': i}, self.processed[i].value) for i in shards]),
+            ('shard_updates_dropped_total', 'counter', 'Updates dropped because the shard worker had exited',
+             [({'shard': i}, self.dropped[i]) for i in shards]),
+            ('shard_queue_depth', 'gauge', 'Updates waiting in a shard queue',
+             [({'shard': i}, self.queues[i].qsize()) for i in shards]),
+        ]
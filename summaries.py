@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import async_db
+import energy
+from config import (
+    SUMMARY_HOUR,
+    SUMMARY_CHECK_INTERVAL,
+    SUMMARY_RATE,
+    SUMMARY_CHAT_INTERVAL,
+    SUMMARY_CONCURRENCY,
+    SUMMARY_RETRIES
+)
+from handlers import progress_text, main_menu_keyboard
+from weather_api import get_temperature, get_utc_offset
+
+# отметки об отправке пишутся пачками, чтобы после падения посреди рассылки
+# повторно ушло не больше этого числа сводок
+MARK_EVERY = 100
+
+
+class TokenBucket:
+    # Не больше rate выдач в секунду в среднем и не больше burst подряд
+    # (при burst=1 выдачи идут равномерно, раз в 1/rate секунд).
+    # pause() останавливает выдачу, пока не истечёт flood wait от Telegram.
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+        self._tokens = 0
+        self._updated = self._resume_at
+
+
+class ChatPacer:
+    # не чаще одного сообщения в interval секунд в один чат
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = {}
+
+    async def wait(self, chat_id):
+        now = time.monotonic()
+        at = self._next.get(chat_id, 0.0)
+        self._next[chat_id] = max(now, at) + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def clear(self):
+        self._next.clear()
+
+
+class SummaryScheduler:
+    # Раз в interval секунд проверяет, в каких городах пользователей уже наступил
+    # час hour по местному времени, одним запросом на локальный день читает
+    # профили и итоги всех, кому ещё не ушла сводка за этот день, считает цели
+    # для всех сразу (energy.targets) и рассылает сводки через общий TokenBucket.
+    # Отправленные сводки отмечаются в summary_log, так что после перезапуска
+    # в тот же вечер они не дублируются.
+    def __init__(self, bot, hour=SUMMARY_HOUR, interval=SUMMARY_CHECK_INTERVAL,
+                 rate=SUMMARY_RATE, chat_interval=SUMMARY_CHAT_INTERVAL,
+                 concurrency=SUMMARY_CONCURRENCY, retries=SUMMARY_RETRIES):
+        self.bot = bot
+        self.hour = hour
+        self.interval = interval
+        self.concurrency = concurrency
+        self.retries = retries
+        self.bucket = TokenBucket(rate)
+        self.pacer = ChatPacer(chat_interval)
+        self.stats = {'sent': 0, 'skipped': 0, 'failed': 0, 'flood_waits': 0}
+        self._task = None
+
+    async def due_days(self):
+        # {(локальный день, смещение от UTC в с): [города]} для городов, где уже
+        # наступил вечер; без города — по часовому поясу сервера, как в
+        # обработчиках, город с неизвестным поясом — по UTC
+        due = {}
+        utc_now = datetime.now(timezone.utc)
+        server_offset = int(datetime.now().astimezone().utcoffset().total_seconds())
+        for city in await async_db.get_user_cities():
+            offset = (await get_utc_offset(city) or 0) if city else server_offset
+            local_now = utc_now + timedelta(seconds=offset)
+            if local_now.hour >= self.hour:
+                due.setdefault((local_now.strftime('%Y-%m-%d'), offset), []).append(city)
+        return due
+
+    async def build_messages(self, rows, day):
+        temps = {city: await get_temperature(city) for city in {row[7] for row in rows} if city}
+        temp = np.array([temps.get(row[7]) for row in rows], dtype=np.float64)
+        targets = energy.targets(energy.ProfileArrays.from_rows(rows), temp)
+        return [
+            (row[0], progress_text(
+                f'Итоги дня {day}', row[8:11],
+                targets.calories[i], targets.burn_goal[i], targets.water[i]
+            ))
+            for i, row in enumerate(rows)
+        ]
+
+    async def run_once(self):
+        sent = 0
+        for (day, offset), cities in (await self.due_days()).items():
+            rows = await async_db.get_summary_candidates(cities, day, offset)
+            if rows:
+                sent += await self.broadcast(await self.build_messages(rows, day), day)
+        self.pacer.clear()
+        return sent
+
+    async def broadcast(self, messages, day):
+        # несколько отправок в работе одновременно, темп задают bucket и pacer
+        queue = iter(messages)
+        done = []
+        total = 0
+
+        async def worker():
+            nonlocal done, total
+            for chat_id, text in queue:
+                if await self._send(chat_id, text):
+                    done.append((chat_id, day))
+                    total += 1
+                if len(done) >= MARK_EVERY:
+                    batch, done = done, []
+                    await async_db.mark_summaries_sent(batch)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        if done:
+            await async_db.mark_summaries_sent(done)
+        return total
+
+    async def _send(self, chat_id, text):
+        # True — сводку больше отправлять не нужно (доставлена или чат недоступен)
+        for _ in range(self.retries + 1):
+            await self.pacer.wait(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, text, reply_markup=main_menu_keyboard())
+            except TelegramRetryAfter as e:
+                self.stats['flood_waits'] += 1
+                self.bucket.pause(e.retry_after)
+                continue
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # бот заблокирован или чата нет: повторять бесполезно
+                logging.info('Summary for %s skipped: %s', chat_id, e)
+                self.stats['skipped'] += 1
+                return True
+            except Exception:
+                logging.exception('Failed to send summary to %s', chat_id)
+                break
+            self.stats['sent'] += 1
+            return True
+        self.stats['failed'] += 1
+        return False
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logging.exception('Daily summaries failed')
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
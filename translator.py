@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import async_db
+from cache import TTLCache
+from config import TRANSLATION_CACHE_SIZE
+from nutrition_api import normalize_name
+
+# частые продукты переводятся без обращения к сети
+FALLBACK = {
+    'гречка': 'buckwheat',
+    'гречневая каша': 'buckwheat porridge',
+    'рис': 'rice',
+    'овсянка': 'oatmeal',
+    'овсяная каша': 'oatmeal',
+    'манная каша': 'semolina porridge',
+    'пшено': 'millet',
+    'макароны': 'pasta',
+    'хлеб': 'bread',
+    'белый хлеб': 'white bread',
+    'черный хлеб': 'rye bread',
+    'чёрный хлеб': 'rye bread',
+    'картофель': 'potato',
+    'картошка': 'potato',
+    'пюре': 'mashed potatoes',
+    'банан': 'banana',
+    'яблоко': 'apple',
+    'груша': 'pear',
+    'апельсин': 'orange',
+    'мандарин': 'tangerine',
+    'виноград': 'grapes',
+    'клубника': 'strawberry',
+    'арбуз': 'watermelon',
+    'огурец': 'cucumber',
+    'помидор': 'tomato',
+    'томат': 'tomato',
+    'морковь': 'carrot',
+    'капуста': 'cabbage',
+    'брокколи': 'broccoli',
+    'лук': 'onion',
+    'свекла': 'beet',
+    'свёкла': 'beet',
+    'куриная грудка': 'chicken breast',
+    'курица': 'chicken',
+    'говядина': 'beef',
+    'свинина': 'pork',
+    'индейка': 'turkey',
+    'рыба': 'fish',
+    'лосось': 'salmon',
+    'тунец': 'tuna',
+    'яйцо': 'egg',
+    'яйца': 'eggs',
+    'творог': 'cottage cheese',
+    'сыр': 'cheese',
+    'молоко': 'milk',
+    'кефир': 'kefir',
+    'йогурт': 'yogurt',
+    'сметана': 'sour cream',
+    'масло': 'butter',
+    'сливочное масло': 'butter',
+    'оливковое масло': 'olive oil',
+    'орехи': 'nuts',
+    'грецкий орех': 'walnut',
+    'миндаль': 'almonds',
+    'мёд': 'honey',
+    'мед': 'honey',
+    'сахар': 'sugar',
+    'шоколад': 'chocolate',
+    'колбаса': 'sausage',
+    'сосиски': 'hot dog',
+    'пельмени': 'dumplings',
+    'борщ': 'borscht',
+    'фасоль': 'beans',
+    'горох': 'peas',
+    'чечевица': 'lentils',
+    'авокадо': 'avocado',
+    'кофе': 'coffee',
+    'чай': 'tea',
+}
+
+_translator = None
+# googletrans синхронный и не рассчитан на параллельные вызовы: один поток на все переводы
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='translator')
+_memo = TTLCache(TRANSLATION_CACHE_SIZE, float('inf'))
+_stats = {'fallback': 0, 'memory': 0, 'db': 0, 'remote': 0}
+
+
+def _get_translator():
+    # googletrans (вместе с httpx) импортируется в потоке переводчика при первом
+    # обращении к сети, а не при старте бота
+    global _translator
+    if _translator is None:
+        from googletrans import Translator
+        _translator = Translator()
+    return _translator
+
+
+def _translate_sync(text):
+    return _get_translator().translate(text, src='ru', dest='en').text
+
+
+async def prewarm():
+    await asyncio.get_running_loop().run_in_executor(_executor, _get_translator)
+
+
+async def translate_ru_en(text):
+    key = normalize_name(text)
+    if key in FALLBACK:
+        _stats['fallback'] += 1
+        return FALLBACK[key]
+    translated = _memo.get(key)
+    if translated is not None:
+        _stats['memory'] += 1
+        return translated
+    translated = await async_db.get_translation(key)
+    if translated is not None:
+        _stats['db'] += 1
+        _memo.set(key, translated)
+        return translated
+    _stats['remote'] += 1
+    loop = asyncio.get_running_loop()
+    try:
+        translated = await loop.run_in_executor(_executor, _translate_sync, text)
+    except Exception:
+        logging.exception('Translation of %r failed', text)
+        return text
+    await async_db.save_translation(key, translated)
+    _memo.set(key, translated)
+    return translated
+
+
+def cache_stats():
+    total = sum(_stats.values())
+    return {**_stats, 'hit_rate': (total - _stats['remote']) / total if total else 0.0}
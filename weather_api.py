@@ -1,44 +1,87 @@
-import requests
 from datetime import datetime, timedelta, timezone
-from config import OPENWEATHER_API_KEY
+from cache import TTLCache, SingleFlight, MISSING
+from config import (
+    OPENWEATHER_API_KEY,
+    OPENWEATHER_API_URL,
+    WEATHER_TEMP_TTL,
+    WEATHER_TZ_TTL,
+    WEATHER_CACHE_SIZE
+)
+from http_client import get_json
 
+_temp_cache = TTLCache(WEATHER_CACHE_SIZE, WEATHER_TEMP_TTL)
+_tz_cache = TTLCache(WEATHER_CACHE_SIZE, WEATHER_TZ_TTL)
+# одновременные промахи по одному городу ждут один запрос /weather
+_flights = SingleFlight()
+_upstream_calls = 0
 
-def get_temperature(city):
-    if not city:
-        return None
-    url = 'http://api.openweathermap.org/data/2.5/weather'
+
+def _city_key(city):
+    return ' '.join(city.lower().split())
+
+
+async def _fetch_weather(city):
+    # один запрос /weather заполняет оба кэша; неизвестный город тоже кэшируется
+    # (как None) на время жизни температуры, сетевые ошибки — нет
+    global _upstream_calls
+    url = f'{OPENWEATHER_API_URL}/weather'
     params = {
         'q': city,
         'appid': OPENWEATHER_API_KEY,
         'units': 'metric',
         'lang': 'ru'
     }
+    _upstream_calls += 1
     try:
-        response = requests.get(url, params=params)
-        data = response.json()
-        if data.get('cod') != 200:
-            return None
-        return data['main']['temp']
-    except:
+        data = await get_json(url, params)
+    except Exception:
+        return None, None
+    key = _city_key(city)
+    if data.get('cod') != 200:
+        _temp_cache.set(key, None)
+        _tz_cache.set(key, None, ttl=WEATHER_TEMP_TTL)
+        return None, None
+    temp = data.get('main', {}).get('temp')
+    offset = data.get('timezone', 0)
+    _temp_cache.set(key, temp)
+    _tz_cache.set(key, offset)
+    return temp, offset
+
+
+def _coalesced_fetch(city):
+    return _flights.do(_city_key(city), _fetch_weather, city)
+
+
+async def get_temperature(city):
+    if not city:
         return None
+    temp = _temp_cache.get(_city_key(city), MISSING)
+    if temp is MISSING:
+        temp, _ = await _coalesced_fetch(city)
+    return temp
 
 
-def get_local_time_for_city(city):
+async def get_utc_offset(city):
     if not city:
-        return datetime.now(timezone.utc)
-    url = 'http://api.openweathermap.org/data/2.5/weather'
-    params = {
-        'q': city,
-        'appid': OPENWEATHER_API_KEY
+        return None
+    offset = _tz_cache.get(_city_key(city), MISSING)
+    if offset is MISSING:
+        _, offset = await _coalesced_fetch(city)
+    return offset
+
+
+async def get_local_time_for_city(city):
+    offset_seconds = await get_utc_offset(city)
+    utc_now = datetime.now(timezone.utc)
+    if offset_seconds is None:
+        return utc_now
+    return utc_now + timedelta(seconds=offset_seconds)
+
+
+def cache_stats():
+    return {
+        'temperature': _temp_cache.stats(),
+        'timezone': _tz_cache.stats(),
+        'upstream_calls': _upstream_calls,
+        'coalesced': _flights.shared,
     }
-    try:
-        resp = requests.get(url, params=params)
-        data = resp.json()
-        if data.get('cod') != 200:
-            return datetime.now(timezone.utc)
-        offset_seconds = data.get('timezone', 0)
-        utc_now = datetime.now(timezone.utc)
-        local_now = utc_now + timedelta(seconds=offset_seconds)
-        return local_now
-    except:
-        return datetime.now(timezone.utc)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_SHUTDOWN_TIMEOUT
+)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    # Апдейт подтверждается сразу, а обрабатывается в фоне. Число одновременно
+    # работающих обработчиков ограничивает сам диспетчер (ChatScheduler в
+    # OrderedDispatcher): место там занимается, только когда подошла очередь чата,
+    # так что апдейты, ждущие в очереди одного чата, не задерживают остальные.
+    # С background=False апдейт передаётся dp до ответа на POST — для ShardRouter,
+    # который только кладёт его в очередь воркера: при заполненной очереди ответ
+    # задерживается, и Telegram сам притормаживает отправку. При остановке новые
+    # апдейты получают 503 (Telegram пришлёт их повторно), а начатые дорабатываются.
+    def __init__(self, dp, bot, background=True, shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT):
+        self.dp = dp
+        self.bot = bot
+        self.background = background
+        self.shutdown_timeout = shutdown_timeout
+        self.processed = 0
+        self._tasks = set()
+        self._accepting = True
+
+    async def handle(self, request):
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        if not self._accepting:
+            return web.Response(status=503)
+        update = await request.json()
+        if not self.background:
+            await self._process(update)
+            return web.Response()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update):
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        except Exception:
+            logging.exception('Failed to process update %s', update.get('update_id'))
+        finally:
+            self.processed += 1
+
+    async def drain(self):
+        self._accepting = False
+        if self._tasks:
+            logging.info('Waiting for %d in-flight updates', len(self._tasks))
+            _, pending = await asyncio.wait(self._tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self.handle)
+        return app
+
+
+async def run(dp, bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT, background=True):
+    server = WebhookServer(dp, bot, background)
+    runner = web.AppRunner(server.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await dp.emit_startup(bot=bot)
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+    logging.info('Webhook server listening on %s:%s%s', host, port, WEBHOOK_PATH)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.drain()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()